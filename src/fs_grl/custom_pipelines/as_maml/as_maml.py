@@ -7,7 +7,6 @@ import torch
 from hydra.utils import instantiate
 from torch import nn
 from torch.optim import Optimizer
-from torch_geometric.data import Batch
 from torchmetrics import Accuracy
 
 from fs_grl.custom_pipelines.as_maml.graph_embedder import GraphEmbedder
@@ -226,8 +225,6 @@ class AS_MAML(MetaLearningModel):
         final_query_accs = []
 
         for episode_idx, (episode_supports, episode_queries) in enumerate(zip(supports_by_episode, queries_by_episode)):
-            episode_supports = Batch.from_data_list(episode_supports)
-            episode_queries = Batch.from_data_list(episode_queries)
 
             stop_gates = []
             query_accs = []
@@ -265,7 +262,7 @@ class AS_MAML(MetaLearningModel):
                     diffopt.step(supports_loss)
 
                     with torch.no_grad():
-                        train_preds = torch.softmax(train_logits, dim=-1)
+                        train_preds = train_logits.argmax(dim=-1)
                         inner_accuracy.update(train_preds, episode_supports.local_y)
 
                     with torch.set_grad_enabled(metatrain):
@@ -274,8 +271,8 @@ class AS_MAML(MetaLearningModel):
                         self.train_query_losses.append(query_loss.cpu())
 
                     with torch.no_grad():
-                        test_preds = torch.softmax(test_logits, dim=-1)
-                        num_corrects = torch.sum(torch.argmax(test_preds, dim=1) == episode_queries.local_y)
+                        test_preds = test_logits.argmax(dim=-1)
+                        num_corrects = torch.sum(test_preds == episode_queries.local_y)
                         query_acc = num_corrects / episode_queries.local_y.shape[0]
                         query_accs.append(query_acc)
 
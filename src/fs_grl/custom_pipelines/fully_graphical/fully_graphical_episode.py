@@ -57,12 +57,10 @@ class FullyGraphicalEpisodeBatch(EpisodeBatch):
         supports: List[Data] = flatten([episode.supports for episode in episode_list])
         # B * N * Q
         queries: List[Data] = flatten([episode.queries for episode in episode_list])
-        # B * N
-        global_labels: List[int] = flatten([episode.property for episode in episode_list])
-
         supports_batch: Batch = Batch.from_data_list(supports)
         queries_batch: Batch = Batch.from_data_list(queries)
-        global_labels_batch = torch.tensor(global_labels)
+        # B * N
+        global_labels_batch = cls.get_global_labels_batch(episode_list, episode_hparams)
 
         if add_prototype_nodes:
             cls.update_supports_batch_with_prototype_edges(
@@ -70,7 +68,9 @@ class FullyGraphicalEpisodeBatch(EpisodeBatch):
             )
 
         # shape (B*(N*Q)*N)
-        cosine_targets = cls.get_cosine_targets(episode_list)
+        cosine_targets = cls.get_cosine_targets(
+            query_labels=queries_batch.y, global_labels=global_labels_batch, num_episodes=len(episode_list)
+        )
 
         episode_batch = cls(
             supports=supports_batch,
@@ -85,7 +85,7 @@ class FullyGraphicalModule(PrototypeBased):
     def compute_loss(self, model_out, batch: EpisodeBatch, **kwargs):
         similarities = model_out["similarities"]
 
-        return self.loss_func(similarities, batch.cosine_targets)
+        return self.loss_func(similarities, batch.cosine_targets.to(similarities.dtype))
 
     def get_prototypes(self, embedded_supports: torch.Tensor, label_to_prototype_idx_mapping: List[Dict]):
         """
@@ -171,6 +171,12 @@ class FullyGraphical(BaseModule):
 
         return step_out
 
+    def on_validation_epoch_end(self) -> None:
+        self.log_per_class_metrics(split="val", cm_reset=True)
+
+    def on_test_epoch_end(self) -> None:
+        self.log_per_class_metrics(split="test", cm_reset=True)
+
     def get_predictions(self, similarities: torch.Tensor, batch: EpisodeBatch) -> torch.Tensor:
         """
 
@@ -181,8 +187,9 @@ class FullyGraphical(BaseModule):
         num_classes_per_episode = batch.episode_hparams.num_classes_per_episode
 
         # shape (B*(N*Q), N) contains the similarity between the query
-        # and the N label prototypes for each of the N*Q queries
-        similarities_per_label = similarities.reshape((-1, num_classes_per_episode))
+        # and the N label prototypes for each of the N*Q queries,
+        # the similarities come out of a reduction and are contiguous so this is always a view
+        similarities_per_label = similarities.view(-1, num_classes_per_episode)
 
         # shape (B*(N*Q)) contains for each query the most similar label
         pred_labels = torch.argmax(similarities_per_label, dim=-1)
@@ -203,22 +210,13 @@ class FullyGraphical(BaseModule):
 
         :return
         """
-        global_labels_per_episode = batch_global_labels.reshape(num_episodes, -1)
-        pred_labels = pred_labels.reshape(num_episodes, -1)
-
-        mapped_labels = []
-        for episode_num in range(num_episodes):
+        # shape (B, N)
+        global_labels_per_episode = batch_global_labels.view(num_episodes, -1)
+        # shape (B, N*Q)
+        pred_labels = pred_labels.view(num_episodes, -1)
 
-            # shape (N)
-            episode_global_labels = global_labels_per_episode[episode_num]
-            # shape (N*Q)
-            episode_pred_labels = pred_labels[episode_num]
-            # shape (N*Q)
-            episode_mapped_labels = episode_global_labels[episode_pred_labels]
-
-            mapped_labels.append(episode_mapped_labels)
+        # shape (B, N*Q), mapped_labels[b, q] = global_labels_per_episode[b, pred_labels[b, q]]
+        mapped_labels = torch.gather(global_labels_per_episode, dim=1, index=pred_labels)
 
         # shape (B*N*Q)
-        mapped_labels = torch.cat(mapped_labels, dim=0)
-
-        return mapped_labels
+        return mapped_labels.view(-1)
@@ -67,5 +67,8 @@ class GraphKernel(BaseModule):
 
         return predictions
 
+    def on_test_epoch_end(self) -> None:
+        self.log_per_class_metrics(split="test", cm_reset=True)
+
     def configure_optimizers(self):
         pass
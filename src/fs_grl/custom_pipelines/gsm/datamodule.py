@@ -50,6 +50,8 @@ class GSMDataModule(GraphTransferDataModule):
 
         self.num_clusters = num_clusters
 
+        self.load_dataset()
+
         label_to_prototype_index_dict = self.create_or_load_spectral_prototypes(spectral_prototypes_path)
         self.label_to_prototype_index_dict = OrderedDict(
             sorted(label_to_prototype_index_dict.items(), key=lambda t: t[0])
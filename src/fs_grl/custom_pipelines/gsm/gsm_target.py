@@ -42,9 +42,6 @@ class GraphSpectralMeasuresTarget(TransferLearningTarget):
 
         self.episodes_counter = 0
 
-    def save_initial_state(self):
-        torch.save(self.state_dict(), self.initial_state_path)
-
     def training_step(self, batch: EpisodeBatch, batch_idx: int) -> Mapping[str, Any]:
         self.train()
         self.embedder.eval()
@@ -97,8 +94,7 @@ class GraphSpectralMeasuresTarget(TransferLearningTarget):
         logits = logits[num_supports:]
         targets = batch.queries.y
 
-        class_probs = torch.log_softmax(logits, dim=-1)
-        preds = torch.argmax(class_probs, dim=-1)
+        preds = logits.argmax(dim=-1)
 
         for metric in self.test_metrics.values():
             metric(preds=preds, target=targets)
@@ -11,6 +11,10 @@ pylogger = logging.getLogger(__name__)
 
 # TODO: get it back to work and refactor
 class GraphCurriculumDataModule(GraphEpisodicDataModule):
+    # the curriculum dataset reads trainer.global_step from the workers, which only get a copy of the trainer
+    # when they are started: they are restarted at every epoch to see the current step
+    persistent_workers: bool = False
+
     def __init__(
         self,
         dataset_name: str,
@@ -25,6 +29,8 @@ class GraphCurriculumDataModule(GraphEpisodicDataModule):
         batch_size: DictConfig,
         num_workers: DictConfig,
         gpus: Optional[Union[List[int], str, int]],
+        prefetch_factor: int = 2,
+        cache_data: bool = False,
         **kwargs,
     ):
 
@@ -39,6 +45,8 @@ class GraphCurriculumDataModule(GraphEpisodicDataModule):
             batch_size=batch_size,
             num_workers=num_workers,
             gpus=gpus,
+            prefetch_factor=prefetch_factor,
+            cache_data=cache_data,
         )
         self.prototypes_path = prototypes_path
         self.max_difficult_step = max_difficult_step
@@ -1,13 +1,17 @@
+import hashlib
 import json
 import logging
+import pickle
 from abc import ABC
 from collections import Counter
+from functools import cached_property
 from pathlib import Path
 from typing import Dict, List, Optional, Sequence, Union
 
 import networkx as nx
+import numpy as np
 import pytorch_lightning as pl
-from omegaconf import DictConfig
+from omegaconf import DictConfig, OmegaConf
 from torch.utils.data import Dataset
 from torch_geometric.data import Data
 
@@ -21,12 +25,20 @@ from fs_grl.data.io_utils import (
     load_pickle_data,
     map_classes_to_labels,
 )
-from fs_grl.data.utils import flatten, get_label_to_samples_map, random_split_bucketed
+from fs_grl.data.utils import (
+    get_dataloader_kwargs,
+    get_label_to_samples_map,
+    get_seeded_rng,
+    random_split_bucketed,
+)
 
 pylogger = logging.getLogger(__name__)
 
 
 class GraphFewShotDataModule(pl.LightningDataModule, ABC):
+    # keep the DataLoader workers alive across epochs
+    persistent_workers: bool = True
+
     def __init__(
         self,
         dataset_name,
@@ -39,6 +51,8 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
         batch_size: DictConfig,
         num_workers: DictConfig,
         gpus: Optional[Union[List[int], str, int]],
+        prefetch_factor: int = 2,
+        cache_data: bool = False,
         **kwargs,
     ):
         """
@@ -62,6 +76,9 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
         :param num_workers:
         :param gpus:
 
+        :param prefetch_factor: how many batches each worker loads in advance
+        :param cache_data: whether to cache the loaded dataset in data_dir and reuse it in later runs
+
         :param kwargs:
         """
         super().__init__()
@@ -76,6 +93,7 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
         self.num_workers = num_workers
         self.batch_size = batch_size
         self.pin_memory: bool = gpus is not None and str(gpus) != "0"
+        self.prefetch_factor = prefetch_factor
 
         assert batch_size.test == 1
 
@@ -83,7 +101,30 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
         self.val_datasets: Optional[Sequence[Dataset]] = None
         self.test_datasets: Optional[Sequence[Dataset]] = None
 
-        data = self.load_data(data_dir, dataset_name, feature_params)
+        self.dataset_name = dataset_name
+        self.data_dir = data_dir
+        self.feature_params = feature_params
+        self.cache_data = cache_data
+
+        self.rng: np.random.Generator = get_seeded_rng()
+
+        # the dataset is loaded by `load_dataset`, on the first read of `metadata` or `feature_dim` or call to `setup`
+        self.data_list: Optional[List[Data]] = None
+
+    def load_dataset(self):
+        """
+        Loads the dataset and indexes it by label, only once. The load is deferred from the constructor until
+        `metadata` or `feature_dim` is first read or `setup` is first called. The entry points read `metadata`
+        right after instantiating the datamodule, so in a run the dataset is still loaded upfront in the main
+        process: the deferral only makes instantiating the datamodule by itself cheap.
+        """
+        if self.data_list is not None:
+            return
+
+        if self.cache_data:
+            data = self.load_cached_data(self.data_dir, self.dataset_name, self.feature_params)
+        else:
+            data = self.load_data(self.data_dir, self.dataset_name, self.feature_params)
         self.data_list, self.graph_list = data["data_list"], data["graph_list"]
         self.classes_split, self.class_to_label_dict = data["classes_split"], data["class_to_label_dict"]
 
@@ -92,17 +133,20 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
         self.base_labels, self.novel_labels = self.labels_split["base"], self.labels_split["novel"]
         self.val_labels = self.labels_split["val"] if "val" in self.labels_split.keys() else self.base_labels
 
+        self.base_labels_set, self.novel_labels_set = set(self.base_labels), set(self.novel_labels)
+        self.val_labels_set = set(self.val_labels)
+
         self.data_list_by_label: Dict[int, List[Data]] = get_label_to_samples_map(self.data_list)
         self.graph_list_by_label: Dict[int, List[nx.Graph]] = get_label_to_samples_map(self.graph_list)
 
         self.data_list_by_base_label = {
-            label: data_list for label, data_list in self.data_list_by_label.items() if label in self.base_labels
+            label: data_list for label, data_list in self.data_list_by_label.items() if label in self.base_labels_set
         }
         self.data_list_by_novel_label = {
-            label: data_list for label, data_list in self.data_list_by_label.items() if label in self.novel_labels
+            label: data_list for label, data_list in self.data_list_by_label.items() if label in self.novel_labels_set
         }
         self.graph_list_by_base_label = {
-            label: graph_list for label, graph_list in self.graph_list_by_label.items() if label in self.base_labels
+            label: graph_list for label, graph_list in self.graph_list_by_label.items() if label in self.base_labels_set
         }
 
         self.print_dataset_info()
@@ -148,6 +192,39 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
             "class_to_label_dict": class_to_label_dict,
         }
 
+    def load_cached_data(self, data_dir, dataset_name, feature_params) -> Dict:
+        """
+        Load data from the cache in data_dir if present, else load it with `load_data` and cache it.
+        The cache is keyed by the dataset name, the feature params and the classes split path.
+        """
+        if isinstance(feature_params, DictConfig):
+            feature_params = OmegaConf.to_container(feature_params, resolve=True)
+
+        cache_key = json.dumps(
+            {
+                "dataset_name": dataset_name,
+                "feature_params": feature_params,
+                "classes_split_path": self.classes_split_path,
+            },
+            sort_keys=True,
+        )
+        cache_digest = hashlib.sha256(cache_key.encode("utf-8")).hexdigest()[:16]
+        cache_path = Path(data_dir) / "cache" / f"{dataset_name}_{cache_digest}.pickle"
+
+        if cache_path.exists():
+            pylogger.info(f"Loading cached data from '{cache_path}'")
+            with open(cache_path, "rb") as f:
+                return pickle.load(f)
+
+        data = self.load_data(data_dir, dataset_name, feature_params)
+
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(cache_path, "wb") as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        pylogger.info(f"Cached data to '{cache_path}'")
+
+        return data
+
     @property
     def labels_split(self):
         return {
@@ -175,8 +252,12 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
 
         return metadata
 
-    @property
+    @cached_property
     def feature_dim(self) -> int:
+        """
+        Dimension of the node features, reading it loads the dataset if it is not loaded yet.
+        """
+        self.load_dataset()
         ref_data = self.data_list[0]
         return ref_data.x.shape[-1]
 
@@ -195,19 +276,22 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
         """
         Split the samples in base and novel ones according to the labels
         """
-        base_samples: List[List[Data]] = [samples for samples in self.data_list_by_base_label.values()]
-        base_samples: List[Data] = flatten(base_samples)
+        has_val_split = "val" in self.classes_split
 
-        novel_samples: List[List[Data]] = [samples for samples in self.data_list_by_novel_label.values()]
-        novel_samples: List[Data] = flatten(novel_samples)
+        base_samples: List[Data] = []
+        val_samples: List[Data] = []
+        novel_samples: List[Data] = []
 
-        if "val" in self.labels_split.keys():
-            val_samples: List[List[Data]] = [
-                samples for key, samples in self.data_list_by_label.items() if key in self.val_labels
-            ]
-            val_samples = flatten(val_samples)
-        else:
-            base_samples, val_samples = random_split_bucketed(base_samples, self.train_ratio)
+        for label, samples in self.data_list_by_label.items():
+            if label in self.base_labels_set:
+                base_samples.extend(samples)
+            if label in self.novel_labels_set:
+                novel_samples.extend(samples)
+            if has_val_split and label in self.val_labels_set:
+                val_samples.extend(samples)
+
+        if not has_val_split:
+            base_samples, val_samples = random_split_bucketed(base_samples, self.train_ratio, self.rng)
 
         return {"base": base_samples, "val": val_samples, "novel": novel_samples}
 
@@ -220,5 +304,18 @@ class GraphFewShotDataModule(pl.LightningDataModule, ABC):
             f"\n{self.val_labels}\nnovel labels:\n{self.novel_labels}"
         )
 
+    def get_dataloader_kwargs(self, split: str) -> Dict:
+        """
+        Worker-related DataLoader arguments for the given split
+
+        :param split: train, val or test
+        """
+        return get_dataloader_kwargs(
+            num_workers=self.num_workers[split],
+            pin_memory=self.pin_memory,
+            prefetch_factor=self.prefetch_factor,
+            persistent_workers=self.persistent_workers,
+        )
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(" f"{self.num_workers=}, " f"{self.batch_size=})"
@@ -25,6 +25,8 @@ class GraphEpisodicDataModule(GraphFewShotDataModule):
         batch_size: DictConfig,
         num_workers: DictConfig,
         gpus: Optional[Union[List[int], str, int]],
+        prefetch_factor: int = 2,
+        cache_data: bool = False,
         **kwargs,
     ):
         """
@@ -49,6 +51,9 @@ class GraphEpisodicDataModule(GraphFewShotDataModule):
         :param num_workers:
         :param gpus:
 
+        :param prefetch_factor: how many batches each worker loads in advance
+        :param cache_data: whether to cache the loaded dataset in data_dir and reuse it in later runs
+
         :param kwargs:
         """
         self.episode_hparams = DotDict(
@@ -66,12 +71,16 @@ class GraphEpisodicDataModule(GraphFewShotDataModule):
             num_workers=num_workers,
             batch_size=batch_size,
             gpus=gpus,
+            prefetch_factor=prefetch_factor,
+            cache_data=cache_data,
         )
 
         self.num_episodes_per_epoch = num_episodes_per_epoch
 
     def setup(self, stage: Optional[str] = None):
 
+        self.load_dataset()
+
         if stage is None or stage == "fit":
 
             split_samples = self.split_base_novel_samples()
@@ -114,8 +123,7 @@ class GraphEpisodicDataModule(GraphFewShotDataModule):
             dataset=self.train_dataset,
             episode_hparams=self.episode_hparams.train,
             batch_size=self.batch_size.train,
-            num_workers=self.num_workers.train,
-            pin_memory=self.pin_memory,
+            **self.get_dataloader_kwargs("train"),
         )
 
     def val_dataloader(self):
@@ -125,8 +133,7 @@ class GraphEpisodicDataModule(GraphFewShotDataModule):
                 episode_hparams=self.episode_hparams.val,
                 shuffle=False,
                 batch_size=self.batch_size.val,
-                num_workers=self.num_workers.val,
-                pin_memory=self.pin_memory,
+                **self.get_dataloader_kwargs("val"),
             )
             for dataset in self.val_datasets
         ]
@@ -138,8 +145,7 @@ class GraphEpisodicDataModule(GraphFewShotDataModule):
                 episode_hparams=self.episode_hparams.test,
                 shuffle=False,
                 batch_size=self.batch_size.test,
-                num_workers=self.num_workers.test,
-                pin_memory=self.pin_memory,
+                **self.get_dataloader_kwargs("test"),
             )
             for dataset in self.test_datasets
         ]
@@ -1,8 +1,9 @@
-import json
 import logging
 from pathlib import Path
 from typing import Dict
 
+import orjson
+
 pylogger = logging.getLogger(__name__)
 
 
@@ -50,7 +51,7 @@ class MetaData:
             "classes_split": self.classes_split,
         }
 
-        (dst_path / "data.json").write_text(json.dumps(data, indent=4, default=lambda x: x.__dict__))
+        (dst_path / "data.json").write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
 
     @staticmethod
     def load(src_path: Path) -> "MetaData":
@@ -63,7 +64,7 @@ class MetaData:
         """
         pylogger.debug(f"Loading MetaData from '{src_path}'")
 
-        data = json.loads((src_path / "data.json").read_text(encoding="utf-8"))
+        data = orjson.loads((src_path / "data.json").read_bytes())
 
         return MetaData(
             class_to_label_dict=data["classes_to_label_dict"],
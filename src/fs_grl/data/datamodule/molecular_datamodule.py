@@ -1,6 +1,7 @@
 import json
 import logging
 from abc import ABC
+from functools import cached_property
 from pathlib import Path
 from typing import Dict, List, Optional, Sequence, Union
 
@@ -16,12 +17,15 @@ from fs_grl.data.datamodule.metadata import MetaData
 from fs_grl.data.dataset.dataloader import MolecularEpisodicDataLoader
 from fs_grl.data.dataset.molecular import IterableMolecularDataset, MapMolecularDataset
 from fs_grl.data.io_utils import data_list_to_graph_list, load_csv_data
-from fs_grl.data.utils import DotDict
+from fs_grl.data.utils import DotDict, get_dataloader_kwargs
 
 pylogger = logging.getLogger(__name__)
 
 
 class MolecularDataModule(pl.LightningDataModule, ABC):
+    # keep the DataLoader workers alive across epochs
+    persistent_workers: bool = True
+
     def __init__(
         self,
         dataset_name: str,
@@ -34,6 +38,7 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
         batch_size: DictConfig,
         num_workers: DictConfig,
         gpus: Optional[Union[List[int], str, int]],
+        prefetch_factor: int = 2,
         **kwargs,
     ):
         """
@@ -57,6 +62,8 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
         :param num_workers:
         :param gpus:
 
+        :param prefetch_factor: how many batches each worker loads in advance
+
         :param kwargs:
         """
         super().__init__()
@@ -77,6 +84,7 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
         self.num_workers = num_workers
         self.batch_size = batch_size
         self.pin_memory: bool = gpus is not None and str(gpus) != "0"
+        self.prefetch_factor = prefetch_factor
 
         assert batch_size.test == 1
 
@@ -172,7 +180,7 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
 
         return metadata
 
-    @property
+    @cached_property
     def feature_dim(self) -> int:
         ref_data = self.data_list[0]
         return ref_data.x.shape[-1]
@@ -188,6 +196,19 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
         pylogger.info("No classes split provided, creating new split.")
         raise NotImplementedError
 
+    def get_dataloader_kwargs(self, split: str) -> Dict:
+        """
+        Worker-related DataLoader arguments for the given split
+
+        :param split: train, val or test
+        """
+        return get_dataloader_kwargs(
+            num_workers=self.num_workers[split],
+            pin_memory=self.pin_memory,
+            prefetch_factor=self.prefetch_factor,
+            persistent_workers=self.persistent_workers,
+        )
+
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}(" f"{self.num_workers=}, " f"{self.batch_size=})"
 
@@ -231,8 +252,7 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
             dataset=self.train_dataset,
             episode_hparams=self.episode_hparams.train,
             batch_size=self.batch_size.train,
-            num_workers=self.num_workers.train,
-            pin_memory=self.pin_memory,
+            **self.get_dataloader_kwargs("train"),
         )
 
     def val_dataloader(self):
@@ -242,8 +262,7 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
                 episode_hparams=self.episode_hparams.val,
                 shuffle=False,
                 batch_size=self.batch_size.val,
-                num_workers=self.num_workers.val,
-                pin_memory=self.pin_memory,
+                **self.get_dataloader_kwargs("val"),
             )
             for dataset in self.val_datasets
         ]
@@ -255,8 +274,7 @@ class MolecularDataModule(pl.LightningDataModule, ABC):
                 episode_hparams=self.episode_hparams.test,
                 shuffle=False,
                 batch_size=self.batch_size.test,
-                num_workers=self.num_workers.test,
-                pin_memory=self.pin_memory,
+                **self.get_dataloader_kwargs("test"),
             )
             for dataset in self.test_datasets
         ]
@@ -2,6 +2,7 @@ import logging
 from collections import Counter
 from typing import Dict, List, Optional, Sequence, Tuple, Union
 
+import torch
 from omegaconf import DictConfig
 from torch.utils.data import DataLoader
 from torch_geometric.data import Batch, Data
@@ -29,6 +30,8 @@ class GraphTransferDataModule(GraphFewShotDataModule):
         batch_size: DictConfig,
         num_workers: DictConfig,
         gpus: Optional[Union[List[int], str, int]],
+        prefetch_factor: int = 2,
+        cache_data: bool = False,
         **kwargs,
     ):
         """
@@ -51,6 +54,9 @@ class GraphTransferDataModule(GraphFewShotDataModule):
         :param num_workers:
         :param gpus:
 
+        :param prefetch_factor: how many batches each worker loads in advance
+        :param cache_data: whether to cache the loaded dataset in data_dir and reuse it in later runs
+
         :param kwargs:
         """
         super().__init__(
@@ -64,10 +70,14 @@ class GraphTransferDataModule(GraphFewShotDataModule):
             batch_size=batch_size,
             num_workers=num_workers,
             gpus=gpus,
+            prefetch_factor=prefetch_factor,
+            cache_data=cache_data,
         )
 
     def setup(self, stage: Optional[str] = None):
 
+        self.load_dataset()
+
         if stage is None or stage == "fit":
 
             split_samples = self.split_base_novel_samples()
@@ -120,8 +130,16 @@ class GraphTransferDataModule(GraphFewShotDataModule):
 
         global_to_local_labels = {label: ind for ind, label in enumerate(sorted(stage_labels))}
 
+        # lookup table global label -> local label over all the dataset labels, -1 for labels not in the stage
+        global_to_local_table = torch.full((max(self.class_to_label_dict.values()) + 1,), -1, dtype=torch.long)
+        global_to_local_table[torch.tensor(sorted(stage_labels))] = torch.arange(len(stage_labels))
+
         for sample in samples:
-            sample.y.apply_(lambda x: global_to_local_labels[x])
+            sample.y = global_to_local_table[sample.y]
+
+        assert all(
+            (sample.y >= 0).all() for sample in samples
+        ), f"Some samples have labels that are not {base_or_novel} labels"
 
         return samples, global_to_local_labels
 
@@ -131,7 +149,9 @@ class GraphTransferDataModule(GraphFewShotDataModule):
         :return
         """
 
-        train_samples, val_samples = random_split_sequence(sequence=data_list, split_ratio=self.train_ratio)
+        train_samples, val_samples = random_split_sequence(
+            sequence=data_list, split_ratio=self.train_ratio, rng=self.rng
+        )
 
         pylogger.info(f"Train label dist: {Counter(sample.y.item() for sample in train_samples)}")
         pylogger.info(f"Val label dist: {Counter(sample.y.item() for sample in val_samples)}")
@@ -145,9 +165,8 @@ class GraphTransferDataModule(GraphFewShotDataModule):
             self.train_dataset,
             batch_size=self.batch_size.train,
             collate_fn=Batch.from_data_list,
-            num_workers=self.num_workers.train,
-            pin_memory=self.pin_memory,
             shuffle=True,
+            **self.get_dataloader_kwargs("train"),
         )
 
     # meta-training validation
@@ -157,9 +176,8 @@ class GraphTransferDataModule(GraphFewShotDataModule):
                 dataset,
                 shuffle=False,
                 batch_size=self.batch_size.val,
-                num_workers=self.num_workers.val,
-                pin_memory=self.pin_memory,
                 collate_fn=Batch.from_data_list,
+                **self.get_dataloader_kwargs("val"),
             )
             for dataset in self.val_datasets
         ]
@@ -172,8 +190,7 @@ class GraphTransferDataModule(GraphFewShotDataModule):
                 episode_hparams=self.test_episode_hparams,
                 shuffle=False,
                 batch_size=self.batch_size.test,
-                num_workers=self.num_workers.test,
-                pin_memory=self.pin_memory,
+                **self.get_dataloader_kwargs("test"),
             )
             for dataset in self.test_datasets
         ]
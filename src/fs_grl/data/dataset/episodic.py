@@ -1,14 +1,14 @@
-import math
 import random
 from abc import ABC
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
+import numpy as np
 import torch
 from torch.utils.data import Dataset
 from torch_geometric.data import Data
 
 from fs_grl.data.episode.episode import Episode, EpisodeHParams
-from fs_grl.data.utils import get_label_to_samples_map
+from fs_grl.data.utils import flatten, get_label_to_samples_map, get_seeded_rng
 
 
 class EpisodicDataset(ABC):
@@ -37,6 +37,15 @@ class EpisodicDataset(ABC):
 
         self.samples_by_label: Dict[int : List[Data]] = get_label_to_samples_map(self.samples)
 
+        # samples grouped by label in a flat array, samples with label l are in
+        # samples_flat[label_offsets[label_to_slot[l]] : label_offsets[label_to_slot[l] + 1]]
+        self.samples_flat = np.empty(len(self.samples), dtype=object)
+        self.samples_flat[:] = flatten(self.samples_by_label.values())
+        self.label_offsets = np.cumsum([0] + [len(samples) for samples in self.samples_by_label.values()])
+        self.label_to_slot: Dict[int, int] = {label: slot for slot, label in enumerate(self.samples_by_label.keys())}
+
+        self.rng: np.random.Generator = get_seeded_rng()
+
     def sample_episode(self):
         f"""
         Creates an episode by first sampling {self.episode_hparams.num_classes_per_episode} classes
@@ -46,36 +55,46 @@ class EpisodicDataset(ABC):
 
         episode_labels = self.sample_labels()
 
-        supports: List[Data] = []
-        queries: List[Data] = []
+        supports_idxs, queries_idxs = self.sample_queries_supports_idxs(episode_labels)
 
-        for label in episode_labels:
-            label_supports_queries = self.sample_label_queries_supports(label)
+        supports: List[Data] = self.samples_flat[self.rng.permutation(supports_idxs)].tolist()
+        queries: List[Data] = self.samples_flat[self.rng.permutation(queries_idxs)].tolist()
 
-            supports += label_supports_queries["supports"]
-            queries += label_supports_queries["queries"]
+        return Episode(supports, queries, episode_labels, episode_hparams=self.episode_hparams)
 
-        random.shuffle(supports)
-        random.shuffle(queries)
+    def sample_queries_supports_idxs(self, labels: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Given N labels, samples K supports and Q queries for each of them. These are always disjoint inside
+        the episode. Each label only draws its K+Q samples, so the cost does not depend on the class sizes.
 
-        return Episode(supports, queries, episode_labels, episode_hparams=self.episode_hparams)
+        :param labels: the N labels of the episode
 
-    def sample_label_queries_supports(self, label: int) -> Dict[str, List[Data]]:
-        f"""
-        Given a label {label}, samples K support and Q queries. These are always disjoint inside the episode.
+        :return indices in samples_flat of the supports ~(N*K) and of the queries ~(N*Q)
         """
+        num_supports = self.episode_hparams.num_supports_per_class
+        num_samples_per_label = num_supports + self.episode_hparams.num_queries_per_class
 
-        all_label_supports: List[Data] = self.samples_by_label[label]
+        supports_idxs: List[np.ndarray] = []
+        queries_idxs: List[np.ndarray] = []
 
-        label_samples_episode = random.sample(
-            all_label_supports,
-            self.episode_hparams.num_supports_per_class + self.episode_hparams.num_queries_per_class,
-        )
+        for label in labels:
+            slot = self.label_to_slot[label]
+            label_start, label_end = self.label_offsets[slot], self.label_offsets[slot + 1]
+
+            if label_end - label_start < num_samples_per_label:
+                raise ValueError(
+                    f"Label {label} has {label_end - label_start} samples, "
+                    f"at least {num_samples_per_label} are needed to sample an episode"
+                )
+
+            label_samples_idxs = label_start + self.rng.choice(
+                label_end - label_start, size=num_samples_per_label, replace=False
+            )
 
-        label_supports_episode = label_samples_episode[: self.episode_hparams.num_supports_per_class]
-        label_queries_episode = label_samples_episode[self.episode_hparams.num_supports_per_class :]
+            supports_idxs.append(label_samples_idxs[:num_supports])
+            queries_idxs.append(label_samples_idxs[num_supports:])
 
-        return {"supports": label_supports_episode, "queries": label_queries_episode}
+        return np.concatenate(supports_idxs), np.concatenate(queries_idxs)
 
     def sample_labels(self) -> List:
         """
@@ -110,9 +129,12 @@ class IterableEpisodicDataset(torch.utils.data.IterableDataset, EpisodicDataset)
             worker_id = 0
         else:  # in a worker process
             worker_id = worker_info.id
-            per_worker = math.ceil(int(self.num_episodes / float(worker_info.num_workers)))
+            # integer split of the episodes, the first num_episodes % num_workers workers take one more
+            per_worker = self.num_episodes // worker_info.num_workers
+            per_worker += int(worker_id < self.num_episodes % worker_info.num_workers)
 
         random.seed(worker_id)
+        self.rng = np.random.default_rng(worker_id)
 
         return iter(self.sample_episode() for _ in range(per_worker))
 
@@ -1,4 +1,3 @@
-import math
 import random
 from abc import ABC
 from typing import Dict, List
@@ -108,7 +107,9 @@ class IterableMolecularDataset(torch.utils.data.IterableDataset, MolecularDatase
             worker_id = 0
         else:  # in a worker process
             worker_id = worker_info.id
-            per_worker = math.ceil(int(self.num_episodes / float(worker_info.num_workers)))
+            # integer split of the episodes, the first num_episodes % num_workers workers take one more
+            per_worker = self.num_episodes // worker_info.num_workers
+            per_worker += int(worker_id < self.num_episodes % worker_info.num_workers)
 
         random.seed(worker_id)
 
@@ -1,11 +1,26 @@
-import itertools
+from functools import lru_cache
 from typing import Dict, List
 
+import numpy as np
 import torch
 from torch_geometric.data import Batch, Data
 
 from fs_grl.data.episode.episode import Episode, EpisodeHParams, MolecularEpisode
-from fs_grl.data.utils import SampleType, flatten
+from fs_grl.data.utils import SampleType, collate_and_split, flatten, split_batch
+
+
+@lru_cache(maxsize=16)
+def compute_episode_delimiters(num_episodes: int, num_samples_per_episode: int) -> torch.Tensor:
+    """
+    Index of the first sample of each episode in the batch, followed by the total number of samples.
+    Only depends on the batch shape, so it is cached and must not be modified in place.
+
+    :param num_episodes: B
+    :param num_samples_per_episode: N*K for supports, N*Q for queries
+
+    :return tensor (B+1)
+    """
+    return torch.arange(0, (num_episodes + 1) * num_samples_per_episode, num_samples_per_episode)
 
 
 class EpisodeBatch:
@@ -28,7 +43,7 @@ class EpisodeBatch:
         assert global_labels.shape[0] == num_episodes * episode_hparams.num_classes_per_episode
 
         self.episode_hparams = episode_hparams
-        self.num_episodes = num_episodes
+        self.num_episodes: int = num_episodes
 
         self.supports = supports
         self.queries = queries
@@ -55,12 +70,9 @@ class EpisodeBatch:
         supports: List[Data] = flatten([episode.supports for episode in episode_list])
         # B * N * Q
         queries: List[Data] = flatten([episode.queries for episode in episode_list])
+        supports_batch, queries_batch = collate_and_split(supports, queries)
         # B * N
-        global_labels: List[int] = flatten([episode.property for episode in episode_list])
-
-        supports_batch: Batch = Batch.from_data_list(supports)
-        queries_batch: Batch = Batch.from_data_list(queries)
-        global_labels_batch = torch.tensor(global_labels)
+        global_labels_batch = cls.get_global_labels_batch(episode_list, episode_hparams)
 
         return {
             "supports": supports_batch,
@@ -70,6 +82,24 @@ class EpisodeBatch:
             "num_episodes": len(episode_list),
         }
 
+    @classmethod
+    def get_global_labels_batch(cls, episode_list: List[Episode], episode_hparams: EpisodeHParams) -> torch.Tensor:
+        """
+        Gathers the global labels of the episodes in a tensor without building an intermediate list
+
+        :param episode_list: list of episodes
+        :param episode_hparams: N, K and Q
+
+        :return tensor ~(B*N) containing for each episode the considered global labels
+        """
+        global_labels = np.fromiter(
+            (label for episode in episode_list for label in episode.property),
+            dtype=np.int64,
+            count=len(episode_list) * episode_hparams.num_classes_per_episode,
+        )
+
+        return torch.from_numpy(global_labels)
+
     @classmethod
     def from_episode_list(
         cls,
@@ -101,24 +131,28 @@ class EpisodeBatch:
 
         EpisodeBatch contains BxNxK support graphs and BxNxQ query graphs
 
-        Returns B lists of (NxK) graphs each if sample_type is support
-            or  B lists of (NxQ) graphs each if sample_type is query
+        Returns B Batches of (NxK) graphs each if sample_type is support
+            or  B Batches of (NxQ) graphs each if sample_type is query
         """
 
         samples_batch = self.samples[sample_type]
 
-        # list containing (BxNxK) supports or (BxNxQ) queries
-        samples_list = Batch.to_data_list(samples_batch)
-
         # how many supports or queries for episode
         num_samples_ep = self.num_samples_per_episode[sample_type]
 
-        samples_by_episode = [
-            samples_list[i * num_samples_ep : i * num_samples_ep + num_samples_ep] for i in range(self.num_episodes)
-        ]
+        # the episodes are sliced out of the collated batch instead of being collated again from the graphs
+        samples_by_episode: List[Batch] = split_batch(samples_batch, [num_samples_ep] * self.num_episodes)
 
         return samples_by_episode
 
+    def get_episode_delimiters(self, sample_type: SampleType) -> torch.Tensor:
+        """
+        Index of the first support or query of each episode, followed by the total number of supports or queries
+
+        :return: tensor (B+1)
+        """
+        return compute_episode_delimiters(self.num_episodes, self.num_samples_per_episode[sample_type])
+
     def get_global_labels_by_episode(self) -> torch.Tensor:
         """
         Split global labels tensor ~ (B*N) by episode
@@ -151,15 +185,22 @@ class EpisodeBatch:
         query_labels_by_episode = self.queries.y.view((self.num_episodes, self.episode_hparams.num_queries_per_episode))
         return query_labels_by_episode
 
-    def to(self, device):
-        self.supports = self.supports.to(device)
-        self.queries = self.queries.to(device)
-        self.global_labels = self.global_labels.to(device)
+    def to(self, device, non_blocking: bool = True):
+        """
+        Moves the batch to device, the copy is asynchronous w.r.t. the host if the batch is in pinned memory
+        """
+        self.supports = self.supports.to(device, non_blocking=non_blocking)
+        self.queries = self.queries.to(device, non_blocking=non_blocking)
+        self.global_labels = self.global_labels.to(device, non_blocking=non_blocking)
+        self.samples = {SampleType.QUERY: self.queries, SampleType.SUPPORT: self.supports}
+
+        return self
 
     def pin_memory(self):
         for key, attr in self.__dict__.items():
             if attr is not None and hasattr(attr, "pin_memory"):
-                attr.pin_memory()
+                setattr(self, key, attr.pin_memory())
+        self.samples = {SampleType.QUERY: self.queries, SampleType.SUPPORT: self.supports}
 
         return self
 
@@ -181,7 +222,7 @@ class CosineEpisodeBatch(EpisodeBatch):
         :param global_labels: tensor containing for each episode the considered global labels (BxN)
         :param episode_hparams: N, K, Q
         :param num_episodes: how many episodes per batch, i.e. batch size
-        :param cosine_targets:
+        :param cosine_targets: int8 tensor with the target similarities in {-1, 1} (BxNxQxN)
         """
         super().__init__(supports, queries, global_labels, episode_hparams, num_episodes)
 
@@ -197,7 +238,11 @@ class CosineEpisodeBatch(EpisodeBatch):
         kwargs = super().episode_batch_kwargs(episode_list, episode_hparams)
 
         # shape (B*(N*Q)*N)
-        cosine_targets = cls.get_cosine_targets(episode_list)
+        cosine_targets = cls.get_cosine_targets(
+            query_labels=kwargs["queries"].y,
+            global_labels=kwargs["global_labels"],
+            num_episodes=kwargs["num_episodes"],
+        )
 
         kwargs["cosine_targets"] = cosine_targets
         episode_batch = cls(**kwargs)
@@ -205,34 +250,34 @@ class CosineEpisodeBatch(EpisodeBatch):
         return episode_batch
 
     @classmethod
-    def get_cosine_targets(cls, episode_list: List[Episode]) -> torch.Tensor:
+    def get_cosine_targets(
+        cls, query_labels: torch.Tensor, global_labels: torch.Tensor, num_episodes: int
+    ) -> torch.Tensor:
         """
-        :param episode_list: list of episodes in the batch
+        :param query_labels: tensor ~(B*(N*Q)) containing the global label of each query in the batch
+        :param global_labels: tensor ~(B*N) containing for each episode the considered global labels
+        :param num_episodes: how many episodes in the batch, i.e. B
 
         :return tensor ~(B*(N*Q)*N) where for each episode in [1, ..., B] there are all the
                  target similarities between the N*Q queries and the N considered global labels
                  Query q in [1, ..., (N*Q)] and label l in [1, ..., N] will have sim(q, l) = 1 if
                  query q has label l, else -1
         """
-        cosine_targets = []
-        for episode in episode_list:
-
-            # shape ((N*Q)*N)
-            episode_cosine_targets = []
+        # shape (B, N*Q, 1)
+        query_labels_by_episode = query_labels.view(num_episodes, -1, 1)
+        # shape (B, 1, N)
+        global_labels_by_episode = global_labels.view(num_episodes, 1, -1)
 
-            for query, label in itertools.product(episode.queries, episode.property):
-                query_label_similarity = (query.y.item() == label) * 2 - 1
-                episode_cosine_targets.append(query_label_similarity)
+        # shape (B, N*Q, N), int8 is enough to hold {-1, 1} and keeps the host-to-device copy small
+        cosine_targets = (query_labels_by_episode == global_labels_by_episode).to(torch.int8) * 2 - 1
 
-            cosine_targets.append(torch.tensor(episode_cosine_targets, dtype=torch.long))
+        return cosine_targets.view(-1)
 
-        cosine_targets = torch.cat(cosine_targets, dim=-1)
+    def to(self, device, non_blocking: bool = True):
+        super().to(device, non_blocking=non_blocking)
+        self.cosine_targets = self.cosine_targets.to(device, non_blocking=non_blocking)
 
-        return cosine_targets
-
-    def to(self, device):
-        super().to(device)
-        self.cosine_targets = self.cosine_targets.to(device)
+        return self
 
 
 class MolecularEpisodeBatch:
@@ -255,7 +300,7 @@ class MolecularEpisodeBatch:
         """
 
         self.episode_hparams = episode_hparams
-        self.num_episodes = num_episodes
+        self.num_episodes: int = num_episodes
 
         self.supports = supports
         self.queries = queries
@@ -283,16 +328,15 @@ class MolecularEpisodeBatch:
         supports: List[Data] = flatten([episode.supports for episode in episode_list])
         # B * 2 * Q
         queries: List[Data] = flatten([episode.queries for episode in episode_list])
+
+        supports_batch, queries_batch = collate_and_split(supports, queries)
         # B
-        properties: List[int] = [episode.property for episode in episode_list]
+        properties_batch = torch.from_numpy(
+            np.fromiter((episode.property for episode in episode_list), dtype=np.int64, count=len(episode_list))
+        )
         # B * 2
         # build the tensor of the classes active/non-active (0/1) referring to the considered property in the episode
-        active_or_not_labels: List[int] = [[0, 1] for _ in episode_list]
-
-        supports_batch: Batch = Batch.from_data_list(supports)
-        queries_batch: Batch = Batch.from_data_list(queries)
-        properties_batch = torch.tensor(properties)
-        active_or_not_labels = torch.tensor(active_or_not_labels)
+        active_or_not_labels = torch.arange(2).repeat(len(episode_list), 1)
 
         return {
             "supports": supports_batch,
@@ -334,24 +378,28 @@ class MolecularEpisodeBatch:
 
         EpisodeBatch contains Bx2xK support graphs and Bx2xQ query graphs
 
-        Returns B lists of (2xK) graphs each if sample_type is support
-            or  B lists of (2xQ) graphs each if sample_type is query
+        Returns B Batches of (2xK) graphs each if sample_type is support
+            or  B Batches of (2xQ) graphs each if sample_type is query
         """
 
         samples_batch = self.samples[sample_type]
 
-        # list containing (BxK) supports or (BxQ) queries
-        samples_list = Batch.to_data_list(samples_batch)
-
         # how many supports or queries for episode
         num_samples_ep = self.num_samples_per_episode[sample_type]
 
-        samples_by_episode = [
-            samples_list[i * num_samples_ep : i * num_samples_ep + num_samples_ep] for i in range(self.num_episodes)
-        ]
+        # the episodes are sliced out of the collated batch instead of being collated again from the graphs
+        samples_by_episode: List[Batch] = split_batch(samples_batch, [num_samples_ep] * self.num_episodes)
 
         return samples_by_episode
 
+    def get_episode_delimiters(self, sample_type: SampleType) -> torch.Tensor:
+        """
+        Index of the first support or query of each episode, followed by the total number of supports or queries
+
+        :return: tensor (B+1)
+        """
+        return compute_episode_delimiters(self.num_episodes, self.num_samples_per_episode[sample_type])
+
     def get_active_or_not_labels_by_episode(self) -> torch.Tensor:
         """
         Split global labels tensor ~ (B*N) by episode
@@ -384,14 +432,22 @@ class MolecularEpisodeBatch:
         query_labels_by_episode = self.queries.y.view((self.num_episodes, self.episode_hparams.num_queries_per_episode))
         return query_labels_by_episode
 
-    def to(self, device):
-        self.supports = self.supports.to(device)
-        self.queries = self.queries.to(device)
-        self.properties = self.properties.to(device)
+    def to(self, device, non_blocking: bool = True):
+        """
+        Moves the batch to device, the copy is asynchronous w.r.t. the host if the batch is in pinned memory
+        """
+        self.supports = self.supports.to(device, non_blocking=non_blocking)
+        self.queries = self.queries.to(device, non_blocking=non_blocking)
+        self.properties = self.properties.to(device, non_blocking=non_blocking)
+        self.active_or_not_labels = self.active_or_not_labels.to(device, non_blocking=non_blocking)
+        self.samples = {SampleType.QUERY: self.queries, SampleType.SUPPORT: self.supports}
+
+        return self
 
     def pin_memory(self):
         for key, attr in self.__dict__.items():
             if attr is not None and hasattr(attr, "pin_memory"):
-                attr.pin_memory()
+                setattr(self, key, attr.pin_memory())
+        self.samples = {SampleType.QUERY: self.queries, SampleType.SUPPORT: self.supports}
 
         return self
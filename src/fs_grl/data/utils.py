@@ -1,12 +1,13 @@
+import itertools
 import math
 from random import shuffle
-from typing import Dict, Iterable, List, Tuple, Union
+from typing import Dict, Iterable, List, Optional, Tuple, Union
 
 import networkx as nx
 import numpy as np
 import torch
 from backports.strenum import StrEnum
-from torch_geometric.data import Data
+from torch_geometric.data import Batch, Data
 
 
 class DotDict(dict):
@@ -41,35 +42,165 @@ def flatten(iterable: Iterable) -> List:
     return [el for sublist in iterable for el in sublist]
 
 
-def random_split_sequence(sequence: List, split_ratio: float) -> Tuple[List, List]:
+def fast_batch(data_list: List[Data]) -> Batch:
+    """
+    Collates a list of plain Data objects with the tensor attributes of the first one into a Batch, equivalent to
+    Batch.from_data_list. Sizes and offsets are computed once per attribute from the tensor shapes instead of
+    going through the generic per-attribute, per-graph collate of PyG. Index attributes (e.g. edge_index) are
+    incremented by the number of nodes of the preceding graphs, all the other attributes are concatenated as they are.
+    Falls back to Batch.from_data_list for anything else, e.g. Data subclasses or non-tensor attributes.
+
+    :param data_list: graphs to collate
+    :return batch
+    """
+    first = data_list[0]
+    keys = list(first._store.keys())
+
+    if (
+        type(first) is not Data
+        or "x" not in keys
+        or any("batch" in key or not isinstance(first[key], torch.Tensor) for key in keys)
+    ):
+        return Batch.from_data_list(data_list)
+
+    num_graphs = len(data_list)
+
+    num_nodes = torch.tensor([data.x.size(0) for data in data_list])
+    ptr = torch.cat((num_nodes.new_zeros(1), num_nodes.cumsum(dim=0)))
+
+    batch = Batch(_base_cls=Data)
+    batch._slice_dict, batch._inc_dict = {}, {}
+
+    for key in keys:
+        values = [data._store[key] for data in data_list]
+        cat_dim = first.__cat_dim__(key, values[0])
+
+        if cat_dim is None or values[0].dim() == 0:
+            values = [value.unsqueeze(0) for value in values]
+            cat_dim = 0
+
+        sizes = torch.tensor([value.size(cat_dim) for value in values])
+        value = torch.cat(values, dim=cat_dim)
+
+        # same increment rule as Data.__inc__
+        if "index" in key or key == "face":
+            incs = ptr[:-1]
+            inc_shape = [1] * value.dim()
+            inc_shape[cat_dim] = -1
+            value = value + incs.repeat_interleave(sizes).view(inc_shape)
+        else:
+            incs = torch.zeros(num_graphs, dtype=torch.long)
+
+        batch[key] = value
+        batch._slice_dict[key] = torch.cat((sizes.new_zeros(1), sizes.cumsum(dim=0)))
+        batch._inc_dict[key] = incs
+
+    batch.batch = torch.arange(num_graphs).repeat_interleave(num_nodes)
+    batch.ptr = ptr
+    batch._num_graphs = num_graphs
+
+    return batch
+
+
+def split_batch(batch: Batch, chunk_sizes: List[int]) -> List[Batch]:
+    """
+    Splits a Batch into consecutive Batches of chunk_sizes graphs each, the result is the same as collating
+    each chunk of graphs separately. Attributes are sliced without going back to the list of graphs,
+    offsets are read from the slice tables, which live on CPU, so no device synchronization is needed.
+
+    :param batch: the Batch to split
+    :param chunk_sizes: number of graphs in each chunk, summing up to the number of graphs in the batch
+    :return list of Batches, one for each chunk
+    """
+    graph_offsets = [0] + list(itertools.accumulate(chunk_sizes))
+    node_slices = batch._slice_dict["x"]
+
+    chunks = []
+    for first_graph, last_graph in zip(graph_offsets[:-1], graph_offsets[1:]):
+        chunk = Batch(_base_cls=batch.__class__)
+        chunk._slice_dict, chunk._inc_dict = {}, {}
+
+        for key, slices in batch._slice_dict.items():
+            value: torch.Tensor = batch[key]
+            cat_dim = batch.__cat_dim__(key, value) or 0
+            start, end = int(slices[first_graph]), int(slices[last_graph])
+
+            chunk_value = value.narrow(cat_dim, start, end - start)
+
+            # attributes such as edge_index have been incremented by the number of nodes of the preceding graphs
+            incs = batch._inc_dict[key]
+            if incs is not None:
+                first_inc = int(incs[first_graph])
+                if first_inc != 0:
+                    chunk_value = chunk_value - first_inc
+                chunk._inc_dict[key] = incs[first_graph:last_graph] - first_inc
+            else:
+                chunk._inc_dict[key] = None
+
+            chunk[key] = chunk_value
+            chunk._slice_dict[key] = slices[first_graph : last_graph + 1] - start
+
+        first_node, last_node = int(node_slices[first_graph]), int(node_slices[last_graph])
+
+        chunk.batch = batch.batch[first_node:last_node] - first_graph
+        chunk.ptr = batch.ptr[first_graph : last_graph + 1] - first_node
+        chunk._num_graphs = last_graph - first_graph
+
+        chunks.append(chunk)
+
+    return chunks
+
+
+def collate_and_split(first: List[Data], second: List[Data]) -> Tuple[Batch, Batch]:
+    """
+    Collates two lists of graphs into two Batches with a single call to fast_batch,
+    the result is the same as collating the two lists separately.
+
+    :param first: graphs of the first batch
+    :param second: graphs of the second batch
+    :return first_batch, second_batch
+    """
+    first_batch, second_batch = split_batch(fast_batch(first + second), [len(first), len(second)])
+
+    return first_batch, second_batch
+
+
+def random_split_sequence(
+    sequence: List, split_ratio: float, rng: Optional[np.random.Generator] = None
+) -> Tuple[List, List]:
     f"""
     Splits a sequence randomly into two sequences, the first having {split_ratio}% of the elements
     and the second having {1-split_ratio}%.
     :param sequence: sequence to be split.
     :param split_ratio: percentage of the elements falling in the first sequence.
+    :param rng: random generator to use, a new one seeded from the global numpy state if not given
     :return subseq_1, subseq_2
     """
+    rng = rng if rng is not None else get_seeded_rng()
 
-    idxs = np.arange(len(sequence))
-    np.random.shuffle(idxs)
+    idxs = rng.permutation(len(sequence))
 
     support_upperbound = math.ceil(split_ratio * len(sequence))
     split_sequence_1_idxs = idxs[:support_upperbound]
     split_sequence_2_idxs = idxs[support_upperbound:]
 
-    split_seq_1 = [sequence[idx] for idx in split_sequence_1_idxs]
-    split_seq_2 = [sequence[idx] for idx in split_sequence_2_idxs]
+    split_seq_1 = list(map(sequence.__getitem__, split_sequence_1_idxs))
+    split_seq_2 = list(map(sequence.__getitem__, split_sequence_2_idxs))
 
     return split_seq_1, split_seq_2
 
 
-def random_split_bucketed(sequence: List, split_ratio: float) -> Tuple[List, List]:
+def random_split_bucketed(
+    sequence: List, split_ratio: float, rng: Optional[np.random.Generator] = None
+) -> Tuple[List, List]:
     """
     Splits a sequence so to have the same distribution in each bucket
     :param sequence:
     :param split_ratio:
+    :param rng: random generator to use, a new one seeded from the global numpy state if not given
     :return
     """
+    rng = rng if rng is not None else get_seeded_rng()
 
     sequence_bucketed = get_label_to_samples_map(sequence)
 
@@ -77,7 +208,7 @@ def random_split_bucketed(sequence: List, split_ratio: float) -> Tuple[List, Lis
     split_sequence_2 = []
 
     for key, subseq in sequence_bucketed.items():
-        split_subseq_1, split_subseq_2 = random_split_sequence(list(subseq), split_ratio)
+        split_subseq_1, split_subseq_2 = random_split_sequence(list(subseq), split_ratio, rng)
         split_sequence_1.append(split_subseq_1)
         split_sequence_2.append(split_subseq_2)
 
@@ -90,6 +221,32 @@ def random_split_bucketed(sequence: List, split_ratio: float) -> Tuple[List, Lis
     return split_sequence_1, split_sequence_2
 
 
+def get_seeded_rng() -> np.random.Generator:
+    """
+    Returns a new numpy Generator seeded from the global numpy random state,
+    so that it is still controlled by seed_everything.
+    """
+    return np.random.default_rng(np.random.randint(np.iinfo(np.int32).max))
+
+
+def get_dataloader_kwargs(num_workers: int, pin_memory: bool, prefetch_factor: int, persistent_workers: bool) -> Dict:
+    """
+    Worker-related DataLoader arguments. The persistence of the workers and the prefetching are only
+    valid when loading with subprocesses, i.e. num_workers > 0.
+
+    :param num_workers: number of loading subprocesses
+    :param pin_memory: whether to copy the batches in pinned memory
+    :param prefetch_factor: how many batches each worker loads in advance
+    :param persistent_workers: whether to keep the workers alive across epochs
+    """
+    dataloader_kwargs = {"num_workers": num_workers, "pin_memory": pin_memory}
+    if num_workers > 0:
+        dataloader_kwargs["persistent_workers"] = persistent_workers
+        dataloader_kwargs["prefetch_factor"] = prefetch_factor
+
+    return dataloader_kwargs
+
+
 def get_label_to_samples_map(annotated_samples: List) -> Dict[int, List[Union[Data, nx.Graph]]]:
     """
     Given a list of annotated_samples, return a map { label: list of samples with that label}
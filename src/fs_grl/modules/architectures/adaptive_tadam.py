@@ -52,16 +52,8 @@ class AdaptiveTADAM(TADAM, AdaptivePrototypicalNetwork):
         episode_embeddings = self.get_episode_embeddings(batch)
         gammas, betas = self.task_embedding_network(episode_embeddings)
 
-        num_supports_repetitions = (
-            torch.tensor([batch.episode_hparams.num_supports_per_episode for _ in range(batch.num_episodes)])
-            .type_as(gammas)
-            .int()
-        )
-        num_queries_repetitions = (
-            torch.tensor([batch.episode_hparams.num_queries_per_episode for _ in range(batch.num_episodes)])
-            .type_as(gammas)
-            .int()
-        )
+        num_supports_repetitions = batch.episode_hparams.num_supports_per_episode
+        num_queries_repetitions = batch.episode_hparams.num_queries_per_episode
 
         query_gammas, query_betas = self.align_gammas_betas(gammas, betas, num_queries_repetitions, batch.queries)
         support_gammas, support_betas = self.align_gammas_betas(gammas, betas, num_supports_repetitions, batch.supports)
@@ -14,7 +14,7 @@ class GNNEmbeddingPairwise(GNNPrototypeBased, abc.ABC):
     def compute_classification_loss(self, model_out, batch: CosineEpisodeBatch, **kwargs):
         similarities = model_out["similarities"]
 
-        return self.loss_func(similarities, batch.cosine_targets)
+        return self.loss_func(similarities, batch.cosine_targets.to(similarities.dtype))
 
     def get_predictions(self, step_out: Dict, batch: EpisodeBatch) -> torch.Tensor:
         """
@@ -30,8 +30,9 @@ class GNNEmbeddingPairwise(GNNPrototypeBased, abc.ABC):
         num_classes_per_episode = batch.episode_hparams.num_classes_per_episode
 
         # shape (B*(N*Q), N) contains the similarity between the query
-        # and the N label prototypes for each of the N*Q queries
-        similarities_per_label = similarities.reshape((-1, num_classes_per_episode))
+        # and the N label prototypes for each of the N*Q queries,
+        # the similarities come out of a reduction and are contiguous so this is always a view
+        similarities_per_label = similarities.view(-1, num_classes_per_episode)
 
         # shape (B*(N*Q)) contains for each query the most similar label
         pred_labels = torch.argmax(similarities_per_label, dim=-1)
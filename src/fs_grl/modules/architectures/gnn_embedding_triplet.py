@@ -4,6 +4,7 @@ import torch
 from torch import nn
 
 from fs_grl.data.episode.episode_batch import EpisodeBatch
+from fs_grl.data.utils import SampleType
 from fs_grl.modules.architectures.gnn_prototype_based import GNNPrototypeBased
 from fs_grl.modules.similarities.cosine import cosine, cosine_distance_1D
 
@@ -58,8 +59,11 @@ class GNNEmbeddingTriplet(GNNPrototypeBased):
         :return
         """
 
-        embedded_queries_per_episode = queries.split(tuple([batch.num_queries_per_episode] * batch.num_episodes))
-        local_labels_per_episode = batch.local_labels.split(tuple([batch.num_queries_per_episode] * batch.num_episodes))
+        num_queries_per_episode = batch.num_samples_per_episode[SampleType.QUERY]
+
+        embedded_queries_per_episode = queries.split(num_queries_per_episode)
+        # the local labels are already assigned when building the episodes, no need to recompute them from the targets
+        local_labels_per_episode = batch.queries.local_y.split(num_queries_per_episode)
 
         batch_queries = []
         batch_positives = []
@@ -95,10 +99,14 @@ class GNNEmbeddingTriplet(GNNPrototypeBased):
         queries_aligned = queries.repeat_interleave(N - 1, dim=0)
         embedding_dim = queries.shape[-1]
 
+        # shape (N*Q, N), a single comparison gives both the positive and the N-1 negative labels of each query
+        is_positive = labels.unsqueeze(-1) == torch.arange(N, device=labels.device)
+
         positives = prototype_matrix[labels]
         positives_aligned = positives.repeat_interleave(N - 1, dim=0)
 
-        not_Y = torch.tensor([[i for i in range(N) if i != y] for y in labels])
+        # shape (N*Q, N-1)
+        not_Y = is_positive.logical_not().nonzero()[:, 1].view(-1, N - 1)
         negatives = prototype_matrix[not_Y]
         negatives_aligned = negatives.reshape(-1, embedding_dim)
 
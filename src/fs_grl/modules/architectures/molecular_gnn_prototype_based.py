@@ -7,7 +7,7 @@ from hydra.utils import instantiate
 from omegaconf import DictConfig
 
 from fs_grl.data.episode.episode_batch import MolecularEpisodeBatch
-from fs_grl.data.utils import SupportsAggregation
+from fs_grl.data.utils import SampleType, SupportsAggregation
 from fs_grl.modules.architectures.prototype_based import MolecularPrototypeBased
 from fs_grl.modules.components.deepsets import DeepSetsEmbedder
 from fs_grl.modules.components.graph_embedder import GraphEmbedder
@@ -238,23 +238,18 @@ class MolecularGNNPrototypeFromNodes(MolecularGNNPrototypeBased, abc.ABC):
 
         graph_cumsizes_in_batch = batch.supports.ptr
 
-        episode_delimiters = torch.tensor(
-            [i * batch.episode_hparams.num_supports_per_episode for i in range(0, batch.num_episodes + 1)],
-            dtype=torch.long,
-        )
-        episode_support_num_nodes = torch.tensor(
-            [graph_cumsizes_in_batch[i] for i in episode_delimiters], dtype=torch.long
-        )
+        episode_delimiters = batch.get_episode_delimiters(SampleType.SUPPORT).to(graph_cumsizes_in_batch.device)
 
-        episode_support_sizes = episode_support_num_nodes[1:] - episode_support_num_nodes[:-1]
+        # shape (B) total number of support nodes in each episode
+        episode_support_sizes = graph_cumsizes_in_batch[episode_delimiters].diff()
 
-        graph_sizes = graph_cumsizes_in_batch[1:] - graph_cumsizes_in_batch[:-1]
+        graph_sizes = graph_cumsizes_in_batch.diff()
         graph_sizes_per_episode = graph_sizes.split(
             tuple([batch.episode_hparams.num_supports_per_episode] * num_episodes)
         )
 
         # sequence of embedded supports for each episode, each has shape (num_support_nodes_episode, hidden_dim)
-        embedded_support_nodes_per_episode = episode_embedded_support_nodes.split(tuple(episode_support_sizes))
+        embedded_support_nodes_per_episode = episode_embedded_support_nodes.split(episode_support_sizes.tolist())
 
         # sequence of labels for each episode, each has shape (num_supports_per_episode)
         support_labels_by_episode = batch.supports.y.view(
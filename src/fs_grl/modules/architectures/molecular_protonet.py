@@ -111,10 +111,8 @@ class MolecularPrototypicalNetwork(MolecularGNNPrototypeFromGraphs):
         )
         logits = -distances
 
-        probabilities = torch.log_softmax(logits, dim=-1)
-
         # shape (B*(N*Q)) contains for each query the most similar label
-        pred_labels = torch.argmax(probabilities, dim=-1)
+        pred_labels = logits.argmax(dim=-1)
 
         pred_active_or_not_labels = self.map_pred_labels_to_active_or_not(
             pred_labels=pred_labels,
@@ -101,23 +101,20 @@ class PrototypicalNetwork(GNNPrototypeFromGraphs):
 
         :return
         """
+        num_episodes = batch.num_episodes
+        N = batch.episode_hparams.num_classes_per_episode
+
         # shape ~(num_episodes * num_queries_per_class * num_classes_per_episode)
         distances = step_out["model_out"]["distances"]
 
-        distances = distances.view(
-            batch.num_episodes,
-            batch.episode_hparams.num_queries_per_episode,
-            batch.episode_hparams.num_classes_per_episode,
-        )
+        distances = distances.view(num_episodes, batch.episode_hparams.num_queries_per_episode, N)
         logits = -distances
 
-        probabilities = torch.log_softmax(logits, dim=-1)
-
         # shape (B*(N*Q)) contains for each query the most similar label
-        pred_labels = torch.argmax(probabilities, dim=-1)
+        pred_labels = logits.argmax(dim=-1)
 
         pred_global_labels = self.map_pred_labels_to_global(
-            pred_labels=pred_labels, batch_global_labels=batch.global_labels, num_episodes=batch.num_episodes
+            pred_labels=pred_labels, batch_global_labels=batch.global_labels, num_episodes=num_episodes
         )
 
         return pred_global_labels
@@ -162,21 +159,24 @@ class PrototypicalNetwork(GNNPrototypeFromGraphs):
         return losses
 
     def compute_classification_loss(self, model_out: Dict, batch: EpisodeBatch, **kwargs):
+        num_episodes = batch.num_episodes
+        N = batch.episode_hparams.num_classes_per_episode
+
         # shape (B, N*Q, N)
         distances = model_out["distances"]
 
-        distances = distances.view(batch.num_episodes, -1, batch.episode_hparams.num_classes_per_episode)
+        distances = distances.view(num_episodes, -1, N)
         logits = -distances
 
         local_labels_per_episode = batch.queries.local_y.view(
-            (batch.num_episodes, batch.episode_hparams.num_queries_per_episode)
+            (num_episodes, batch.episode_hparams.num_queries_per_episode)
         )
 
         cum_loss = 0
-        for episode in range(batch.num_episodes):
+        for episode in range(num_episodes):
             cum_loss += self.loss_func(logits[episode], local_labels_per_episode[episode])
 
-        cum_loss /= batch.num_episodes
+        cum_loss /= num_episodes
         return cum_loss
 
     def compute_total_loss(self, losses):
@@ -182,25 +182,16 @@ class PrototypeBased(abc.ABC, nn.Module):
 
         :return
         """
-        global_labels_per_episode = batch_global_labels.reshape(num_episodes, -1)
-        pred_labels = pred_labels.reshape(num_episodes, -1)
+        # shape (B, N)
+        global_labels_per_episode = batch_global_labels.view(num_episodes, -1)
+        # shape (B, N*Q)
+        pred_labels = pred_labels.view(num_episodes, -1)
 
-        mapped_labels = []
-        for episode_num in range(num_episodes):
-
-            # shape (N)
-            episode_global_labels = global_labels_per_episode[episode_num]
-            # shape (N*Q)
-            episode_pred_labels = pred_labels[episode_num]
-            # shape (N*Q)
-            episode_mapped_labels = episode_global_labels[episode_pred_labels]
-
-            mapped_labels.append(episode_mapped_labels)
+        # shape (B, N*Q), mapped_labels[b, q] = global_labels_per_episode[b, pred_labels[b, q]]
+        mapped_labels = torch.gather(global_labels_per_episode, dim=1, index=pred_labels)
 
         # shape (B*N*Q)
-        mapped_labels = torch.cat(mapped_labels, dim=0)
-
-        return mapped_labels
+        return mapped_labels.view(-1)
 
     @abc.abstractmethod
     def compute_classification_loss(self, embedded_queries, class_prototypes, batch: EpisodeBatch, **kwargs):
@@ -222,22 +213,13 @@ class MolecularPrototypeBased(PrototypeBased):
 
         :return
         """
-        global_labels_per_episode = batch_active_or_not_labels.reshape(num_episodes, -1)
-        pred_labels = pred_labels.reshape(num_episodes, -1)
+        # shape (B, N)
+        global_labels_per_episode = batch_active_or_not_labels.view(num_episodes, -1)
+        # shape (B, N*Q)
+        pred_labels = pred_labels.view(num_episodes, -1)
 
-        mapped_labels = []
-        for episode_num in range(num_episodes):
-
-            # shape (N)
-            episode_global_labels = global_labels_per_episode[episode_num]
-            # shape (N*Q)
-            episode_pred_labels = pred_labels[episode_num]
-            # shape (N*Q)
-            episode_mapped_labels = episode_global_labels[episode_pred_labels]
-
-            mapped_labels.append(episode_mapped_labels)
+        # shape (B, N*Q), mapped_labels[b, q] = global_labels_per_episode[b, pred_labels[b, q]]
+        mapped_labels = torch.gather(global_labels_per_episode, dim=1, index=pred_labels)
 
         # shape (B*N*Q)
-        mapped_labels = torch.cat(mapped_labels, dim=0)
-
-        return mapped_labels
+        return mapped_labels.view(-1)
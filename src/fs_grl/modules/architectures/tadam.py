@@ -21,14 +21,12 @@ class TADAM:
             gamma_0_init=gamma_0_init,
         )
 
-    def align_gammas_betas(
-        self, gammas: torch.Tensor, betas: torch.Tensor, num_sample_repetitions: torch.Tensor, batch: Batch
-    ):
+    def align_gammas_betas(self, gammas: torch.Tensor, betas: torch.Tensor, num_sample_repetitions: int, batch: Batch):
         """
 
         :param gammas:
         :param betas:
-        :param num_sample_repetitions:
+        :param num_sample_repetitions: number of samples of each episode, the same for all the episodes
         :param batch:
 
         :return
@@ -38,11 +36,15 @@ class TADAM:
         gammas_repeated_by_graphs = torch.repeat_interleave(gammas, num_sample_repetitions, dim=0)
         betas_repeated_by_graphs = torch.repeat_interleave(betas, num_sample_repetitions, dim=0)
 
-        _, num_repetitions_nodes = torch.unique(batch.batch, return_counts=True)
+        num_repetitions_nodes = batch.ptr.diff()
 
         # (num_nodes_in_batch, embedding_dim, num_convs)
-        gammas_repeated_by_nodes = torch.repeat_interleave(gammas_repeated_by_graphs, num_repetitions_nodes, dim=0)
-        betas_repeated_by_nodes = torch.repeat_interleave(betas_repeated_by_graphs, num_repetitions_nodes, dim=0)
+        gammas_repeated_by_nodes = torch.repeat_interleave(
+            gammas_repeated_by_graphs, num_repetitions_nodes, dim=0, output_size=batch.num_nodes
+        )
+        betas_repeated_by_nodes = torch.repeat_interleave(
+            betas_repeated_by_graphs, num_repetitions_nodes, dim=0, output_size=batch.num_nodes
+        )
 
         # (num_convs, num_nodes_in_batch, embedding_dim)
         return gammas_repeated_by_nodes.permute(2, 0, 1), betas_repeated_by_nodes.permute(2, 0, 1)
@@ -1,18 +1,28 @@
-import itertools
 import time
 from abc import ABC
-from typing import Any, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
 
 import hydra
 import numpy as np
 import plotly.graph_objects as go
 import pytorch_lightning as pl
 import wandb
-from plotly.graph_objs.layout import Annotation
 from pytorch_lightning.utilities.types import STEP_OUTPUT
 from torch import nn
 from torch.optim import Optimizer
-from torchmetrics import Accuracy, ConfusionMatrix, FBetaScore
+from torchmetrics import Accuracy, ConfusionMatrix, FBetaScore, Metric, MetricCollection
+
+# (reduction, metric name, metric class) of the metrics used for evaluation
+EVALUATION_METRICS = (
+    ("micro", "F1", FBetaScore),
+    ("micro", "acc", Accuracy),
+    ("weighted", "F1", FBetaScore),
+    ("weighted", "acc", Accuracy),
+    ("macro", "F1", FBetaScore),
+    ("macro", "acc", Accuracy),
+    ("none", "F1", FBetaScore),
+    ("none", "acc", Accuracy),
+)
 
 
 class BaseModule(pl.LightningModule, ABC):
@@ -20,23 +30,24 @@ class BaseModule(pl.LightningModule, ABC):
         super().__init__()
         self.test_start_inference_time = None
         self.train_start_time = None
+        self._metric_groups: Dict[str, Tuple[Dict[str, Metric], Dict[str, Metric]]] = {}
 
         self.save_hyperparameters()
         self.metadata = metadata
 
-        reductions = ["micro", "weighted", "macro", "none"]
-        metrics = (("F1", FBetaScore), ("acc", Accuracy))
-
-        self.val_metrics = nn.ModuleDict(
+        # a single collection per split, so that a step updates all its metrics with one call. The collection
+        # is called (forward) to get the per-step values, which runs the forward of each metric, so every
+        # metric still keeps its own statistics
+        self.val_metrics = MetricCollection(
             {
                 f"val/{metric_name}/{reduction}": metric(num_classes=self.metadata.num_classes, average=reduction, task="multiclass")
-                for reduction, (metric_name, metric) in itertools.product(reductions, metrics)
+                for reduction, metric_name, metric in EVALUATION_METRICS
             }
         )
-        self.test_metrics = nn.ModuleDict(
+        self.test_metrics = MetricCollection(
             {
                 f"test/{metric_name}/{reduction}": metric(num_classes=self.metadata.num_classes, average=reduction, task="multiclass")
-                for reduction, (metric_name, metric) in itertools.product(reductions, metrics)
+                for reduction, metric_name, metric in EVALUATION_METRICS
             }
         )
         self.train_metrics = nn.ModuleDict({"train/acc/micro": Accuracy(num_classes=self.metadata.num_classes, task="multiclass")})
@@ -62,22 +73,59 @@ class BaseModule(pl.LightningModule, ABC):
         scheduler = hydra.utils.instantiate(self.hparams.lr_scheduler, optimizer=opt)
         return [opt], [scheduler]
 
+    def get_metric_groups(self, split: str) -> Tuple[Dict[str, Metric], Dict[str, Metric]]:
+        """
+        Splits the metrics of the given split in scalar metrics, which are cheap to log at every step, and
+        per-class ("none" reduction) and confusion matrix metrics, which need a `compute()` and are only logged
+        at the end of the epoch. The groups are built once, as the metrics are not changed after `__init__`.
+
+        :param split: one of "train", "val" or "test"
+        :return scalar metrics and per-class metrics, both as dicts metric_name -> metric
+        """
+        if split not in self._metric_groups:
+            scalar_metrics, per_class_metrics = {}, {}
+            for metric_name, metric in getattr(self, f"{split}_metrics").items():
+                is_per_class = "none" in metric_name or "cm" in metric_name
+                (per_class_metrics if is_per_class else scalar_metrics)[metric_name] = metric
+
+            self._metric_groups[split] = (scalar_metrics, per_class_metrics)
+
+        return self._metric_groups[split]
+
     def log_metrics(self, split: str, on_step: bool, on_epoch: bool, cm_reset: bool):
+        """
+        Logs the metrics of the given split. The scalar metrics are logged as Metric objects, so that Lightning
+        takes care of their epoch-level aggregation; per-class metrics are only logged outside of a step.
+        """
+        scalar_metrics, _ = self.get_metric_groups(split)
+
+        # TODO: fix, this is called in validation_step where the metrics are already computed
+        #       step_wise, but also in on_train_batch_end where the metrics must be computed
+        self.log_dict(scalar_metrics, on_step=on_step, on_epoch=on_epoch)
+
+        if not on_step:
+            self.log_per_class_metrics(split, cm_reset=cm_reset)
+
+    def log_per_class_metrics(self, split: str, cm_reset: bool):
+        """
+        Logs the per-class scores and the confusion matrix of the given split, meant to be called at epoch end.
+        """
+        _, per_class_metrics = self.get_metric_groups(split)
+
         to_log = {}
 
-        for metric_name, metric in getattr(self, f"{split}_metrics").items():
+        for metric_name, metric in per_class_metrics.items():
             if "none" in metric_name:
                 self.handle_no_average_metric(metric_name, metric, to_log)
-            elif "cm" in metric_name:
+                # logged as scores and not as Metric objects, Lightning does not reset them at epoch end
+                metric.reset()
+            else:
                 self.handle_confusion_matrix(metric_name, metric)
                 if cm_reset:
                     metric.reset()
-            else:
-                # TODO: fix, this is called in validation_step where the metrics are already computed
-                #       step_wise, but also in on_train_batch_end where the metrics must be computed
-                to_log[metric_name] = metric
 
-        self.log_dict(to_log, on_step=on_step, on_epoch=on_epoch)
+        if to_log:
+            self.log_dict(to_log, on_step=False, on_epoch=True)
 
     def handle_no_average_metric(self, metric_name, metric, to_log):
         for label, score in list(
@@ -87,7 +135,6 @@ class BaseModule(pl.LightningModule, ABC):
             )
         ):
             to_log[f"{metric_name}/{label}"] = score
-        metric.reset()
 
     def handle_confusion_matrix(self, cm_name, metric):
         fig: go.Figure = self.plot_cm(cm=metric)
@@ -98,17 +145,19 @@ class BaseModule(pl.LightningModule, ABC):
     def plot_cm(self, cm: ConfusionMatrix) -> go.Figure:
         z: np.ndarray = cm.compute().cpu().numpy()
         x = y = list(self.classes)
-        class2index = {c: i for i, c in enumerate(self.classes)}
 
-        hover_text = [[str(y) for y in x] for x in z]
+        hover_text = z.astype(str)
 
-        z = np.nan_to_num((z / z.sum(axis=1)).round(2))
-        z_text = [[str(y) for y in x] for x in z]
+        # rows are normalized by the number of samples of their class, rows without samples stay zero
+        row_sum = z.sum(axis=1, keepdims=True)
+        z = np.divide(z, row_sum, out=np.zeros_like(z, dtype=np.float64), where=row_sum > 0).round(2)
 
+        # the cell values are rendered by the heatmap itself, no need for one annotation per cell
         fig = go.Figure(
             data=go.Heatmap(
                 z=z,
-                text=z_text,
+                text=z,
+                texttemplate="%{text}",
                 x=x,
                 y=y,
                 customdata=hover_text,
@@ -127,26 +176,11 @@ class BaseModule(pl.LightningModule, ABC):
             )
         )
 
-        annotations = []
-        for n, row in enumerate(z):
-            for m, val in enumerate(row):
-                annotations.append(
-                    Annotation(
-                        text=str(z[n][m]),
-                        x=class2index[x[m]],
-                        y=class2index[y[n]],
-                        xref="x1",
-                        yref="y1",
-                        showarrow=False,
-                    )
-                )
-
         fig.update_yaxes(autorange="reversed", type="category")
         fig.update_xaxes(type="category")
 
         fig.update_layout(
             font=dict(family="Courier New, monospace", size=20, color="black"),
-            annotations=annotations,
             xaxis_title="Prediction",
             yaxis_title="Target",
         )
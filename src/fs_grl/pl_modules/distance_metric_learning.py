@@ -1,5 +1,5 @@
 import logging
-from typing import Any, Mapping, Optional
+from typing import Any, Dict, Mapping, Optional
 
 import torch
 from hydra.utils import instantiate
@@ -33,6 +33,21 @@ class DistanceMetricLearning(BaseModule):
         self.classes = list(metadata.classes_to_label_dict.keys())
         self.label_to_class_dict = {v: k for k, v in metadata.classes_to_label_dict.items()}
 
+    def setup(self, stage: Optional[str] = None) -> None:
+        self.build_model()
+
+    def on_load_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        # the weights are loaded right after this hook, the model must exist by then
+        self.build_model()
+
+    def build_model(self):
+        """
+        Instantiates the model. This is deferred from `__init__` to `setup`, so that the model is only built
+        when the trainer needs it and after the datamodule has loaded the data its feature dim depends on.
+        """
+        if hasattr(self, "model"):
+            return
+
         self.model = instantiate(
             self.hparams.model,
             cfg=self.hparams.model,
@@ -85,26 +100,33 @@ class DistanceMetricLearning(BaseModule):
         return step_out
 
     def validation_step(self, batch: EpisodeBatch, batch_idx: int):
-        step_out = self.step(batch, "val")
+        # no gradient is needed in evaluation, inference mode also skips the autograd bookkeeping
+        with torch.inference_mode():
+            step_out = self.step(batch, "val")
 
-        predictions = self.model.get_predictions(step_out, batch)
+            predictions = self.model.get_predictions(step_out, batch)
 
-        for metric_name, metric in self.val_metrics.items():
-            metric(preds=predictions, target=batch.queries.y)
+            self.val_metrics(preds=predictions, target=batch.queries.y)
 
-        self.log_metrics(split="val", on_step=True, on_epoch=True, cm_reset=False)
+            self.log_metrics(split="val", on_step=True, on_epoch=True, cm_reset=False)
 
         return step_out
 
     def test_step(self, batch: EpisodeBatch, batch_idx: int) -> Mapping[str, Any]:
 
-        step_out = self.step(batch, "test", batch_idx=None)
+        with torch.inference_mode():
+            step_out = self.step(batch, "test", batch_idx=None)
 
-        predictions = self.model.get_predictions(step_out, batch)
+            predictions = self.model.get_predictions(step_out, batch)
 
-        for metric_name, metric in self.test_metrics.items():
-            metric(preds=predictions, target=batch.queries.y)
+            self.test_metrics(preds=predictions, target=batch.queries.y)
 
-        self.log_metrics(split="test", on_step=True, on_epoch=True, cm_reset=False)
+            self.log_metrics(split="test", on_step=True, on_epoch=True, cm_reset=False)
 
         return step_out
+
+    def on_validation_epoch_end(self) -> None:
+        self.log_per_class_metrics(split="val", cm_reset=True)
+
+    def on_test_epoch_end(self) -> None:
+        self.log_per_class_metrics(split="test", cm_reset=True)
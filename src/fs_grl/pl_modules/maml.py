@@ -1,4 +1,4 @@
-from typing import Any, Sequence, Tuple, Union
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
 
 import higher
 import hydra
@@ -6,7 +6,6 @@ import torch
 from hydra.utils import instantiate
 from torch import nn
 from torch.optim import Optimizer
-from torch_geometric.data import Batch
 from torchmetrics import Accuracy
 
 from fs_grl.data.episode.episode_batch import EpisodeBatch
@@ -16,25 +15,56 @@ from fs_grl.pl_modules.meta_learning import MetaLearningModel
 
 
 class MAMLModel(MetaLearningModel):
-    def __init__(self, cfg, metadata, num_inner_steps, *args, **kwargs) -> None:
+    def __init__(self, cfg, metadata, num_inner_steps, first_order: bool = False, *args, **kwargs) -> None:
+        """
+        :param cfg:
+        :param metadata:
+        :param num_inner_steps: number of adaptation steps on the supports of each episode, at least 1
+        :param first_order: whether to use the first-order approximation of MAML (FOMAML), i.e. to ignore
+                            the second-order terms that come from differentiating through the inner loop
+        """
+        # the inner metrics are taken from the last inner step, there must be one
+        if num_inner_steps < 1:
+            raise ValueError(f"MAML needs at least one inner step, got num_inner_steps={num_inner_steps}")
+
         super().__init__(metadata=metadata, *args, **kwargs)
         self.save_hyperparameters(logger=False, ignore=("metadata",))
         self.cfg = cfg
 
         self.num_inner_steps = num_inner_steps
+        self.first_order = first_order
+
+        self.inner_loss_func = nn.CrossEntropyLoss()
+        self.outer_loss_func = nn.CrossEntropyLoss()
+
+        # reset at the beginning of each step, they are registered as submodules to follow the model device
+        self.outer_accuracy = Accuracy()
+        self.inner_accuracy = Accuracy()
+
+    def setup(self, stage: Optional[str] = None) -> None:
+        self.build_model()
+
+    def on_load_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        # the weights are loaded right after this hook, the model must exist by then
+        self.build_model()
+
+    def build_model(self):
+        """
+        Instantiates the model and the inner optimizer on its parameters. This is deferred from `__init__`
+        to `setup`, so that the model is only built when the trainer needs it.
+        """
+        if hasattr(self, "gnn_mlp"):
+            return
 
         self.gnn_mlp: GNN_MLP = instantiate(
-            cfg.model,
-            cfg=cfg.model,
-            feature_dim=metadata.feature_dim,
+            self.cfg.model,
+            cfg=self.cfg.model,
+            feature_dim=self.metadata.feature_dim,
             num_classes=self.metadata.num_classes_per_episode,
             _recursive_=False,
         )
 
-        self.inner_optimizer = instantiate(cfg.inner_optimizer, params=self.gnn_mlp.parameters())
-
-        self.inner_loss_func = nn.CrossEntropyLoss()
-        self.outer_loss_func = nn.CrossEntropyLoss()
+        self.inner_optimizer = instantiate(self.cfg.inner_optimizer, params=self.gnn_mlp.parameters())
 
     def forward(self, batch: EpisodeBatch) -> torch.Tensor:
         """ """
@@ -47,22 +77,20 @@ class MAMLModel(MetaLearningModel):
 
         outer_optimizer = self.optimizers()
 
-        outer_loss = torch.tensor(0.0)
-        inner_loss = torch.tensor(0.0)
+        # per-episode losses, reduced with a single stack at the end of the loop
+        outer_losses, inner_losses = [], []
 
-        metric = Accuracy().to(self.device)
-        outer_accuracy = metric.clone()
-        inner_accuracy = metric.clone()
+        outer_accuracy, inner_accuracy = self.outer_accuracy, self.inner_accuracy
+        outer_accuracy.reset()
+        inner_accuracy.reset()
 
         supports_by_episode = batch.split_in_episodes(SampleType.SUPPORT)
         queries_by_episode = batch.split_in_episodes(SampleType.QUERY)
 
-        for episode_idx, (episode_supports, episode_queries) in enumerate(zip(supports_by_episode, queries_by_episode)):
-
-            episode_supports = Batch.from_data_list(episode_supports)
-            episode_queries = Batch.from_data_list(episode_queries)
+        for episode_supports, episode_queries in zip(supports_by_episode, queries_by_episode):
 
-            track_higher_grads = True if metatrain else False
+            first_order = metatrain and self.first_order
+            track_higher_grads = metatrain and not self.first_order
             copy_initial_weights = False if metatrain else True
 
             with higher.innerloop_ctx(
@@ -77,33 +105,58 @@ class MAMLModel(MetaLearningModel):
                     loss = self.inner_loss_func(train_logits, episode_supports.local_y)
                     diffopt.step(loss)
 
-                with torch.no_grad():
-                    train_logits = fmodel(episode_supports)
-                    train_preds = torch.softmax(train_logits, dim=-1)
-                    inner_loss += self.inner_loss_func(train_logits, episode_supports.local_y).cpu()
-                    inner_accuracy.update(train_preds, episode_supports.local_y)
+                # the inner metrics are those of the last inner step, this saves a forward on the supports
+                inner_losses.append(loss.detach())
+                train_preds = train_logits.detach().argmax(dim=-1)
+                inner_accuracy.update(train_preds, episode_supports.local_y)
 
                 test_logits = fmodel(episode_queries)
-                inner_test_loss = self.outer_loss_func(test_logits, episode_queries.local_y).cpu()
-
-                outer_loss += inner_test_loss
+                inner_test_loss = self.outer_loss_func(test_logits, episode_queries.local_y)
+
+                if first_order:
+                    # the inner loop is not tracked, the gradient w.r.t. the adapted weights
+                    # is used as the gradient w.r.t. the initial weights. The backward goes through
+                    # Lightning, so that the precision plugin scales the loss and the backward hooks run
+                    adapted_params = list(fmodel.parameters())
+                    self.manual_backward(inner_test_loss, inputs=adapted_params)
+                    self.accumulate_first_order_grads(adapted_params)
+                    inner_test_loss = inner_test_loss.detach()
+
+                outer_losses.append(inner_test_loss)
                 with torch.no_grad():
-                    test_preds = torch.softmax(test_logits, dim=-1)
+                    test_preds = test_logits.argmax(dim=-1)
                     outer_accuracy.update(test_preds, episode_queries.local_y)
 
+        outer_losses = torch.stack(outer_losses)
+
         if metatrain:
-            self.manual_backward(outer_loss)
+            if not self.first_order:
+                # the meta-gradient is the sum of the per-episode gradients
+                self.manual_backward(outer_losses.sum())
             outer_optimizer.step()
 
-        outer_loss.div_(episode_idx + 1)
-        inner_loss.div_(episode_idx + 1)
+        outer_loss = outer_losses.detach().mean()
+        inner_loss = torch.stack(inner_losses).mean()
 
         return outer_loss, inner_loss, outer_accuracy, inner_accuracy
 
+    def accumulate_first_order_grads(self, adapted_params: Sequence[torch.Tensor]):
+        """
+        Accumulates the gradient of the query loss w.r.t. the adapted weights, already computed by
+        `manual_backward`, in the gradient of the initial weights
+
+        :param adapted_params: adapted weights, in the same order as the initial ones
+        """
+        for param, adapted_param in zip(self.gnn_mlp.parameters(), adapted_params):
+            if adapted_param.grad is None:
+                continue
+            param.grad = adapted_param.grad if param.grad is None else param.grad + adapted_param.grad
+
     def configure_optimizers(
         self,
     ) -> Union[Optimizer, Tuple[Sequence[Optimizer], Sequence[Any]]]:
-        outer_optimizer = hydra.utils.instantiate(self.cfg.outer_optimizer, params=self.parameters())
+        trainable_params = [param for param in self.parameters() if param.requires_grad]
+        outer_optimizer = hydra.utils.instantiate(self.cfg.outer_optimizer, params=trainable_params)
 
         if self.cfg.use_lr_scheduler:
             scheduler = hydra.utils.instantiate(self.cfg.lr_scheduler, optimizer=outer_optimizer)
@@ -1,11 +1,9 @@
 import logging
-from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
+from typing import Any, Mapping, Optional, Sequence, Tuple, Union
 
 import hydra
-import pytorch_lightning
 import torch
 from hydra.utils import instantiate
-from pytorch_lightning.utilities.types import STEP_OUTPUT
 from torch import nn
 from torch.optim import Optimizer
 from torch.optim.lr_scheduler import LambdaLR
@@ -47,22 +45,6 @@ class SimpleTarget(TransferLearningTarget):
 
         self.save_initial_state()
 
-    def save_initial_state(self):
-        torch.save(self.state_dict(), self.initial_state_path)
-
-    def forward(self, samples) -> Dict:
-        """
-        'training_step', 'validation_step' and 'test_step' should call
-        this method in order to compute the output predictions and the loss.
-        Returns:
-            output_dict: forward output containing the predictions (output logits ecc...) and the loss if any.
-        """
-
-        embeddings = self.embedder(samples)
-        logits = self.classifier(embeddings)
-
-        return {"logits": logits}
-
     def step(self, samples, split: str) -> Mapping[str, Any]:
 
         model_out = self(samples)
@@ -80,10 +62,12 @@ class SimpleTarget(TransferLearningTarget):
 
         optimizer = self.optimizers()
 
+        samples = batch.supports
+        # the embedder is frozen, the supports are embedded once for all the fine-tuning steps
+        embeddings = self.embed(samples)
+
         total_loss = torch.tensor(0.0)
         for i in range(self.num_finetuning_steps):
-            samples = batch.supports
-            embeddings = self.embedder(samples)
             logits = self.classifier(embeddings)
 
             loss = self.loss_func(logits, samples.y)
@@ -100,34 +84,6 @@ class SimpleTarget(TransferLearningTarget):
         self.reset_fine_tuning()
         self.freeze_embedder()
 
-    def on_train_batch_end(self, outputs: STEP_OUTPUT, batch: Any, batch_idx: int, unused: Optional[int] = 0) -> None:
-        """
-        Testing of the fine-tuning phase. After the model has trained on the K*N supports, it is
-        tested on the N*Q queries
-        """
-        self.eval()
-        logits = self(batch.queries)["logits"]
-
-        class_probs = torch.log_softmax(logits, dim=-1)
-        preds = torch.argmax(class_probs, dim=-1)
-
-        for metric in self.test_metrics.values():
-            metric(preds=preds, target=batch.queries.y)
-
-        self.log_metrics(split="test", on_step=True, on_epoch=True, cm_reset=False)
-
-    def reset_fine_tuning(self):
-        """
-        Resets the model to the original pretrained state
-        """
-        self.load_state_dict(torch.load(self.initial_state_path))
-        self.trainer: pytorch_lightning.Trainer
-        (
-            self.trainer.optimizers,
-            self.trainer.lr_schedulers,
-            self.trainer.optimizer_frequencies,
-        ) = self.trainer.init_optimizers(model=None)
-
     def freeze_embedder(self):
         self.embedder.eval()
         self.embedder.requires_grad_(False)
@@ -147,7 +103,9 @@ class SimpleTarget(TransferLearningTarget):
             - Tuple of dictionaries as described, with an optional 'frequency' key.
             - None - Fit will run without any optimizer.
         """
-        opt = hydra.utils.instantiate(self.hparams.optimizer, params=self.parameters(), _convert_="partial")
+        # the frozen embedder is left out, so that it gets neither param groups nor optimizer state
+        trainable_params = [param for param in self.parameters() if param.requires_grad]
+        opt = hydra.utils.instantiate(self.hparams.optimizer, params=trainable_params, _convert_="partial")
 
         schedulers = []
         if "lr_scheduler" not in self.hparams:
@@ -1,7 +1,6 @@
 import logging
 from typing import Any, Mapping, Optional
 
-import torch
 from pytorch_lightning.utilities.types import EPOCH_OUTPUT
 
 from nn_core.model_logging import NNLogger
@@ -44,8 +43,7 @@ class TransferLearningSource(BaseModule):
 
         logits = model_out["logits"]
 
-        class_probs = torch.softmax(logits, dim=-1)
-        preds = torch.argmax(class_probs, dim=-1)
+        preds = logits.argmax(dim=-1)
 
         for metric_name, metric in self.train_metrics.items():
             metric_res = metric(preds=preds, target=batch.y)
@@ -61,8 +59,7 @@ class TransferLearningSource(BaseModule):
 
         logits = model_out["logits"]
 
-        class_probs = torch.softmax(logits, dim=-1)
-        preds = torch.argmax(class_probs, dim=-1)
+        preds = logits.argmax(dim=-1)
 
         for metric_name, metric in self.val_metrics.items():
             metric_res = metric(preds=preds, target=batch.y)
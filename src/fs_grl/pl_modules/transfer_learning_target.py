@@ -1,5 +1,5 @@
-import itertools
 import logging
+from concurrent.futures import Future, ThreadPoolExecutor
 from typing import Any, Dict, Mapping, Optional, Sequence, Tuple, Union
 
 import hydra
@@ -10,14 +10,21 @@ from pytorch_lightning.utilities.types import STEP_OUTPUT
 from torch import nn
 from torch.optim import Optimizer
 from torch.optim.lr_scheduler import LambdaLR
-from torchmetrics import Accuracy, FBetaScore
 
 from fs_grl.data.datamodule.metadata import MetaData
 from fs_grl.data.episode.episode_batch import EpisodeBatch
-from fs_grl.pl_modules.base_module import BaseModule
+from fs_grl.pl_modules.base_module import EVALUATION_METRICS, BaseModule
 
 pylogger = logging.getLogger(__name__)
 
+# writes the initial states to disk in the background, a single worker keeps the writes in order
+_SAVE_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+
+def _log_save_error(future: Future):
+    if future.exception() is not None:
+        pylogger.error(f"Could not save the initial state: {future.exception()}")
+
 
 class TransferLearningTarget(BaseModule):
     def __init__(
@@ -36,20 +43,20 @@ class TransferLearningTarget(BaseModule):
         self.freeze_embedder()
 
         self.initial_state_path = initial_state_path
+        # state the model is reset to before fine-tuning on each episode, see `save_initial_state`
+        self._initial_state: Optional[Dict[str, torch.Tensor]] = None
         self.automatic_optimization = False
 
         self.classes = metadata.classes_split["novel"]
 
         self.log_prefix = "meta-testing"
-        reductions = ["micro", "weighted", "macro", "none"]
-        metrics = (("F1", FBetaScore), ("acc", Accuracy))
 
         self.train_metrics = nn.ModuleDict(
             {
                 f"{self.log_prefix}/train/{metric_name}/{reduction}": metric(
                     num_classes=len(self.classes), average=reduction
                 )
-                for reduction, (metric_name, metric) in itertools.product(reductions, metrics)
+                for reduction, metric_name, metric in EVALUATION_METRICS
             }
         )
 
@@ -58,7 +65,7 @@ class TransferLearningTarget(BaseModule):
                 f"{self.log_prefix}/test/{metric_name}/{reduction}": metric(
                     num_classes=len(self.classes), average=reduction
                 )
-                for reduction, (metric_name, metric) in itertools.product(reductions, metrics)
+                for reduction, metric_name, metric in EVALUATION_METRICS
             }
         )
         self.test_metrics[f"{self.log_prefix}/test/cm"] = torchmetrics.ConfusionMatrix(
@@ -66,7 +73,16 @@ class TransferLearningTarget(BaseModule):
         )
 
     def save_initial_state(self):
-        pass
+        """
+        Stores the pretrained state the model is reset to before each episode. The state is kept in memory,
+        so that resetting does not read it back from disk, and is also saved once to `initial_state_path`
+        in a background thread.
+        """
+        self._initial_state = {key: value.detach().clone() for key, value in self.state_dict().items()}
+
+        # the copy is moved to cpu before submitting, so that the background thread only does the I/O
+        cpu_state = {key: value.cpu() for key, value in self._initial_state.items()}
+        _SAVE_EXECUTOR.submit(torch.save, cpu_state, self.initial_state_path).add_done_callback(_log_save_error)
 
     def forward(self, samples) -> Dict:
         """
@@ -76,11 +92,19 @@ class TransferLearningTarget(BaseModule):
             output_dict: forward output containing the predictions (output logits ecc...) and the loss if any.
         """
 
-        embeddings = self.embedder(samples)
+        embeddings = self.embed(samples)
         logits = self.classifier(embeddings)
 
         return {"logits": logits}
 
+    def embed(self, samples) -> torch.Tensor:
+        """
+        Embeds the samples with the frozen embedder. As only the classifier is fine-tuned, no graph is recorded
+        for the embedder and its output can be reused across fine-tuning steps on the same samples.
+        """
+        with torch.no_grad():
+            return self.embedder(samples)
+
     def step(self, samples, split: str) -> Mapping[str, Any]:
 
         model_out = self(samples)
@@ -110,21 +134,30 @@ class TransferLearningTarget(BaseModule):
         tested on the N*Q queries
         """
         self.eval()
-        logits = self(batch.queries)["logits"]
 
-        class_probs = torch.log_softmax(logits, dim=-1)
-        preds = torch.argmax(class_probs, dim=-1)
+        # no autograd bookkeeping is needed to evaluate on the queries
+        with torch.inference_mode():
+            logits = self(batch.queries)["logits"]
+            # the softmax is monotonic, the most likely class is the one with the highest logit
+            preds = logits.argmax(dim=-1)
 
         for metric in self.test_metrics.values():
             metric(preds=preds, target=batch.queries.y)
 
         self.log_metrics(split="test", on_step=True, on_epoch=True, cm_reset=False)
 
+    def on_train_epoch_end(self) -> None:
+        # the queries of all the episodes have been evaluated, per-class scores are computed once over all of them
+        self.log_per_class_metrics(split="test", cm_reset=True)
+
     def reset_fine_tuning(self):
         """
         Resets the model to the original pretrained state
         """
-        self.load_state_dict(torch.load(self.initial_state_path))
+        # keep the initial state on the same device as the model, the reset is then a device-local copy
+        self._initial_state = {key: value.to(self.device) for key, value in self._initial_state.items()}
+        self.load_state_dict(self._initial_state)
+
         self.trainer: pytorch_lightning.Trainer
         (
             self.trainer.optimizers,
@@ -151,7 +184,9 @@ class TransferLearningTarget(BaseModule):
             - Tuple of dictionaries as described, with an optional 'frequency' key.
             - None - Fit will run without any optimizer.
         """
-        opt = hydra.utils.instantiate(self.hparams.optimizer, params=self.parameters(), _convert_="partial")
+        # the frozen embedder is left out, so that it gets neither param groups nor optimizer state
+        trainable_params = [param for param in self.parameters() if param.requires_grad]
+        opt = hydra.utils.instantiate(self.hparams.optimizer, params=trainable_params, _convert_="partial")
 
         schedulers = []
         if "lr_scheduler" not in self.hparams:
@@ -1,9 +1,17 @@
+import random
+from typing import Dict, List
+
+import numpy as np
 import pytest
 import torch
+from torch_geometric.data import Batch, Data
 
 from nn_core.common import PROJECT_ROOT
 
+from fs_grl.data.dataset.episodic import MapEpisodicDataset
+from fs_grl.data.episode.episode import EpisodeHParams
 from fs_grl.data.io_utils import load_graph_list, to_data_list
+from fs_grl.data.utils import collate_and_split, fast_batch, get_dataloader_kwargs, split_batch
 
 
 @pytest.fixture()
@@ -53,6 +61,166 @@ def test_to_data_list(data_list):
         assert torch.equal(edge_indices[graph_name], data[graph_name].edge_index)
 
 
+@pytest.fixture
+def random_data_list():
+    generator = torch.Generator().manual_seed(0)
+
+    data_list = []
+    for graph_idx in range(6):
+        num_nodes = int(torch.randint(1, 8, (1,), generator=generator))
+        num_edges = int(torch.randint(0, 12, (1,), generator=generator))
+        data = Data(
+            x=torch.randn(num_nodes, 3, generator=generator),
+            edge_index=torch.randint(0, num_nodes, (2, num_edges), generator=generator),
+            y=torch.tensor([graph_idx % 3]),
+            local_y=torch.tensor(graph_idx % 2),
+        )
+        data_list.append(data)
+
+    return data_list
+
+
+def assert_same_batch(batch: Batch, expected: Batch):
+    for key in ("x", "edge_index", "y", "local_y", "batch", "ptr"):
+        assert torch.equal(batch[key], expected[key]), key
+
+    assert batch.num_graphs == expected.num_graphs
+
+    for data, expected_data in zip(batch.to_data_list(), expected.to_data_list()):
+        for key in ("x", "edge_index", "y", "local_y"):
+            assert torch.equal(data[key], expected_data[key]), key
+
+
+def test_fast_batch(random_data_list):
+    assert_same_batch(fast_batch(random_data_list), Batch.from_data_list(random_data_list))
+
+
+def test_fast_batch_to_data_list(random_data_list):
+    for data, original in zip(fast_batch(random_data_list).to_data_list(), random_data_list):
+        assert torch.equal(data.x, original.x)
+        assert torch.equal(data.edge_index, original.edge_index)
+        assert torch.equal(data.y, original.y)
+
+
+@pytest.mark.parametrize("chunk_sizes", [[6], [1, 5], [2, 3, 1], [1] * 6])
+def test_split_batch(random_data_list, chunk_sizes):
+    chunks = split_batch(Batch.from_data_list(random_data_list), chunk_sizes)
+
+    assert len(chunks) == len(chunk_sizes)
+
+    first_graph = 0
+    for chunk, chunk_size in zip(chunks, chunk_sizes):
+        expected = Batch.from_data_list(random_data_list[first_graph : first_graph + chunk_size])
+        assert_same_batch(chunk, expected)
+        first_graph += chunk_size
+
+
+def test_collate_and_split(random_data_list):
+    first, second = random_data_list[:2], random_data_list[2:]
+
+    first_batch, second_batch = collate_and_split(first, second)
+
+    assert_same_batch(first_batch, Batch.from_data_list(first))
+    assert_same_batch(second_batch, Batch.from_data_list(second))
+
+
+@pytest.mark.parametrize("persistent_workers", [True, False])
+def test_get_dataloader_kwargs(persistent_workers):
+    kwargs = get_dataloader_kwargs(
+        num_workers=2, pin_memory=True, prefetch_factor=4, persistent_workers=persistent_workers
+    )
+    assert kwargs == {
+        "num_workers": 2,
+        "pin_memory": True,
+        "persistent_workers": persistent_workers,
+        "prefetch_factor": 4,
+    }
+
+    # the worker options are rejected by the DataLoader when loading in the main process
+    kwargs = get_dataloader_kwargs(num_workers=0, pin_memory=False, prefetch_factor=4, persistent_workers=True)
+    assert kwargs == {"num_workers": 0, "pin_memory": False}
+    torch.utils.data.DataLoader([], **kwargs)
+
+
+@pytest.fixture
+def episode_hparams():
+    return EpisodeHParams(num_classes_per_episode=3, num_supports_per_class=2, num_queries_per_class=4)
+
+
+def get_labeled_samples(num_samples_per_label: Dict[int, int]) -> List[Data]:
+    """
+    Samples are identified by their single node feature, which is unique across the samples.
+    """
+    samples = []
+    for label, num_samples in num_samples_per_label.items():
+        for _ in range(num_samples):
+            samples.append(Data(x=torch.tensor([[float(len(samples))]]), y=torch.tensor([label])))
+
+    return samples
+
+
+def get_sample_ids(samples: List[Data]) -> List[int]:
+    return [int(sample.x) for sample in samples]
+
+
+def test_sample_episode(episode_hparams):
+    num_samples_per_label = {0: 6, 1: 10, 2: 50, 3: 7}
+    dataset = MapEpisodicDataset(
+        num_episodes=20,
+        samples=get_labeled_samples(num_samples_per_label),
+        stage_labels=list(num_samples_per_label.keys()),
+        episode_hparams=episode_hparams,
+    )
+
+    for episode in dataset.episodes:
+        assert len(episode.property) == episode_hparams.num_classes_per_episode
+
+        support_labels = [int(sample.y) for sample in episode.supports]
+        query_labels = [int(sample.y) for sample in episode.queries]
+        for label in episode.property:
+            assert support_labels.count(label) == episode_hparams.num_supports_per_class
+            assert query_labels.count(label) == episode_hparams.num_queries_per_class
+
+        support_ids, query_ids = get_sample_ids(episode.supports), get_sample_ids(episode.queries)
+        assert len(set(support_ids)) == len(support_ids)
+        assert len(set(query_ids)) == len(query_ids)
+        assert set(support_ids).isdisjoint(query_ids)
+
+
+def test_sample_episode_too_small_label(episode_hparams):
+    # label 1 has less than K+Q samples
+    num_samples_per_label = {0: 6, 1: 5, 2: 6}
+
+    with pytest.raises(ValueError):
+        MapEpisodicDataset(
+            num_episodes=1,
+            samples=get_labeled_samples(num_samples_per_label),
+            stage_labels=list(num_samples_per_label.keys()),
+            episode_hparams=episode_hparams,
+        )
+
+
+def test_sample_episode_determinism(episode_hparams):
+    num_samples_per_label = {0: 20, 1: 30, 2: 40, 3: 50}
+    samples = get_labeled_samples(num_samples_per_label)
+
+    sampled_ids = []
+    for _ in range(2):
+        random.seed(0)
+        np.random.seed(0)
+        dataset = MapEpisodicDataset(
+            num_episodes=5,
+            samples=samples,
+            stage_labels=list(num_samples_per_label.keys()),
+            episode_hparams=episode_hparams,
+        )
+        sampled_ids.append(
+            [(get_sample_ids(episode.supports), get_sample_ids(episode.queries)) for episode in dataset.episodes]
+        )
+
+    assert sampled_ids[0] == sampled_ids[1]
+
+
 # TODO: fix
 # def test_add_node_degrees_as_tags(data_list):
 #
@@ -0,0 +1,114 @@
+from typing import Tuple
+
+import pytest
+import pytorch_lightning as pl
+import torch
+from omegaconf import OmegaConf
+from torch import nn
+from torch.nn import functional as F
+from torch_geometric.data import Data
+
+from fs_grl.data.datamodule.metadata import MetaData
+from fs_grl.data.dataset.dataloader import EpisodicDataLoader
+from fs_grl.data.dataset.episodic import MapEpisodicDataset
+from fs_grl.data.episode.episode import EpisodeHParams
+from fs_grl.data.episode.episode_batch import EpisodeBatch
+from fs_grl.data.utils import SampleType
+from fs_grl.pl_modules.maml import MAMLModel
+
+FEATURE_DIM = 4
+NUM_LABELS = 3
+NUM_EPISODES = 2
+NUM_INNER_STEPS = 2
+INNER_LR = 0.5
+
+
+class LinearClassifier(nn.Linear):
+    """
+    Classifies graphs made of a single node with a linear map of the node features.
+    """
+
+    def __init__(self, cfg, feature_dim: int, num_classes: int):
+        super().__init__(feature_dim, num_classes)
+
+    def forward(self, batch):
+        return super().forward(batch.x)
+
+
+@pytest.fixture
+def episode_hparams():
+    return EpisodeHParams(num_classes_per_episode=2, num_supports_per_class=2, num_queries_per_class=3)
+
+
+@pytest.fixture
+def episodic_dataset(episode_hparams):
+    torch.manual_seed(0)
+    samples = [
+        Data(x=torch.randn(1, FEATURE_DIM), y=torch.tensor([label])) for label in range(NUM_LABELS) for _ in range(5)
+    ]
+    return MapEpisodicDataset(
+        num_episodes=NUM_EPISODES,
+        samples=samples,
+        stage_labels=list(range(NUM_LABELS)),
+        episode_hparams=episode_hparams,
+    )
+
+
+def linear_cross_entropy_grads(
+    weight: torch.Tensor, bias: torch.Tensor, x: torch.Tensor, y: torch.Tensor
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    """
+    Analytic gradient of the mean cross-entropy of the logits x W^T + b w.r.t. W and b
+    """
+    logits_grad = (torch.softmax(x @ weight.T + bias, dim=-1) - F.one_hot(y, num_classes=weight.shape[0])) / len(y)
+    return logits_grad.T @ x, logits_grad.sum(dim=0)
+
+
+def test_first_order_grads(episode_hparams, episodic_dataset):
+    metadata = MetaData(
+        class_to_label_dict={str(label): label for label in range(NUM_LABELS)},
+        feature_dim=FEATURE_DIM,
+        num_classes_per_episode=episode_hparams.num_classes_per_episode,
+        classes_split={"base": list(range(NUM_LABELS))},
+    )
+    cfg = OmegaConf.create(
+        {
+            "model": {"_target_": f"{__name__}.LinearClassifier"},
+            "inner_optimizer": {"_target_": "torch.optim.SGD", "lr": INNER_LR},
+            # the initial weights are not updated, so that the gradients can be compared with the analytic ones
+            "outer_optimizer": {"_target_": "torch.optim.SGD", "lr": 0.0},
+            "use_lr_scheduler": False,
+        }
+    )
+    model = MAMLModel(cfg=cfg, metadata=metadata, num_inner_steps=NUM_INNER_STEPS, first_order=True)
+
+    dataloader = EpisodicDataLoader(episodic_dataset, episode_hparams=episode_hparams, batch_size=NUM_EPISODES)
+    trainer = pl.Trainer(max_steps=1, gpus=0, logger=False, enable_checkpointing=False, enable_progress_bar=False)
+    trainer.fit(model, train_dataloaders=dataloader)
+
+    weight, bias = model.gnn_mlp.weight.detach(), model.gnn_mlp.bias.detach()
+    expected_weight_grad, expected_bias_grad = torch.zeros_like(weight), torch.zeros_like(bias)
+
+    batch = EpisodeBatch.from_episode_list(episodic_dataset.episodes, episode_hparams=episode_hparams)
+    for supports, queries in zip(
+        batch.split_in_episodes(SampleType.SUPPORT), batch.split_in_episodes(SampleType.QUERY)
+    ):
+        adapted_weight, adapted_bias = weight, bias
+        for _ in range(NUM_INNER_STEPS):
+            weight_grad, bias_grad = linear_cross_entropy_grads(
+                adapted_weight, adapted_bias, supports.x, supports.local_y
+            )
+            adapted_weight, adapted_bias = adapted_weight - INNER_LR * weight_grad, adapted_bias - INNER_LR * bias_grad
+
+        # first-order approximation: the query gradient at the adapted weights
+        weight_grad, bias_grad = linear_cross_entropy_grads(adapted_weight, adapted_bias, queries.x, queries.local_y)
+        expected_weight_grad += weight_grad
+        expected_bias_grad += bias_grad
+
+    assert torch.allclose(model.gnn_mlp.weight.grad, expected_weight_grad, atol=1e-6)
+    assert torch.allclose(model.gnn_mlp.bias.grad, expected_bias_grad, atol=1e-6)
+
+
+def test_no_inner_steps():
+    with pytest.raises(ValueError):
+        MAMLModel(cfg=OmegaConf.create({}), metadata=None, num_inner_steps=0)